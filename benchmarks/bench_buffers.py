@@ -0,0 +1,63 @@
+"""
+Compares `repo_utils.metric_buffer`, which projects sites a group at a time with
+cached transformers, with the per-site pattern of `examples/Buildings.py`, which
+builds a transformer for every geometry, on random points across Africa. Both
+are checked against geodesic distances from each site.
+
+Run from the repository root:
+    python benchmarks/bench_buffers.py [n_sites] [n_loop_sites]
+"""
+
+import os
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pyproj
+import shapely
+from shapely.ops import transform
+
+import repo_utils
+
+N_SITES = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+N_LOOP_SITES = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+RADIUS = 1000
+
+rng = np.random.default_rng(0)
+lon, lat = rng.uniform(-17, 50, N_SITES), rng.uniform(-34, 35, N_SITES)
+points = shapely.points(lon, lat)
+geod = pyproj.Geod(ellps="WGS84")
+
+
+def per_site_buffer(point):
+    local = f"+proj=aeqd +lat_0={point.y} +lon_0={point.x} +datum=WGS84 +units=m"
+    project = partial(pyproj.Transformer.from_crs("EPSG:4326", local, always_xy=True).transform)
+    back = partial(pyproj.Transformer.from_crs(local, "EPSG:4326", always_xy=True).transform)
+    return transform(back, transform(project, point).buffer(RADIUS))
+
+
+def max_error(buffers, sites):
+    errors = []
+    for i, buffer in zip(sites, buffers):
+        xy = shapely.get_coordinates(shapely.get_exterior_ring(buffer))
+        _, _, distance = geod.inv(np.full(len(xy), lon[i]), np.full(len(xy), lat[i]), xy[:, 0], xy[:, 1])
+        errors.append(np.abs(distance - RADIUS).max())
+    return max(errors)
+
+
+start = time.perf_counter()
+loop = [per_site_buffer(point) for point in points[:N_LOOP_SITES]]
+per_site = (time.perf_counter() - start) / N_LOOP_SITES
+checked = rng.choice(N_SITES, min(N_SITES, 500), replace=False)
+
+print(f"{N_SITES} points buffered by {RADIUS} m")
+print(f"per-site transformers: {per_site * N_SITES:.1f} s (from {N_LOOP_SITES} sites), max error {max_error(loop, range(N_LOOP_SITES)):.3f} m")
+for method in ["aeqd", "utm"]:
+    start = time.perf_counter()
+    buffers = repo_utils.metric_buffer(points, RADIUS, method=method)
+    elapsed = time.perf_counter() - start
+    print(f"metric_buffer, {method + ':':<5}  {elapsed:.1f} s, max error {max_error(buffers[checked], checked):.3f} m")
+print(f"buffer_points:          max error {max_error(repo_utils.buffer_points(points[checked], RADIUS), checked):.3f} m")
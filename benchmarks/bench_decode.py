@@ -0,0 +1,52 @@
+"""
+Compares the plan-driven columnar page decoder in `repo_utils.odyssey` with the original
+row-oriented path (DataFrame of objects, then one cast per typed column) on
+synthetic Elasticsearch SQL responses.
+
+Run from the repository root:
+    python benchmarks/bench_decode.py [n_rows]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+
+import repo_utils
+from fake_es import HOURLY_COLUMNS, synthetic_hourly_rows
+
+N_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+PAGE_SIZE = 1000
+
+
+def legacy_decode(rows, cols, columns_meta):
+    df = pd.DataFrame(rows, columns=cols)
+    for col in columns_meta:
+        if col["type"] == "datetime":
+            df[col["name"]] = pd.to_datetime(df[col["name"]])
+        elif col["type"] == "integer":
+            df = df.astype({col["name"]: "Int32"})
+    return df
+
+
+rows = synthetic_hourly_rows(N_ROWS)
+pages = [rows[i : i + PAGE_SIZE] for i in range(0, N_ROWS, PAGE_SIZE)]
+cols = [c["name"] for c in HOURLY_COLUMNS]
+
+start = time.perf_counter()
+legacy = pd.concat([legacy_decode(p, cols, HOURLY_COLUMNS) for p in pages], ignore_index=True)
+legacy_time = time.perf_counter() - start
+
+start = time.perf_counter()
+plan = repo_utils.odyssey._build_decode_plan(HOURLY_COLUMNS)
+columnar = pd.concat([repo_utils.odyssey._decode_page(p, plan) for p in pages], ignore_index=True)
+columnar_time = time.perf_counter() - start
+
+pd.testing.assert_frame_equal(legacy, columnar)
+print(f"{N_ROWS} rows in pages of {PAGE_SIZE}")
+print(f"row-oriented + casts: {legacy_time:6.2f} s")
+print(f"columnar plan:        {columnar_time:6.2f} s ({legacy_time / columnar_time:.1f}x)")
@@ -0,0 +1,51 @@
+"""
+Compares `repo_utils.DistanceIndex` with brute-force blocks of haversine
+distances, for the check that every control point is far enough from the
+treated sites and for each control's nearest site. Also times a full blocked
+distance matrix.
+
+Run from the repository root:
+    python benchmarks/bench_distances.py [n_controls] [n_sites] [n_matrix]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import repo_utils
+
+N_CONTROLS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+N_SITES = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+N_MATRIX = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+DISTANCE = 10000
+
+rng = np.random.default_rng(0)
+# Africa-wide points, in (lon, lat) columns
+sites = np.column_stack([rng.uniform(-17, 50, N_SITES), rng.uniform(-34, 35, N_SITES)])
+controls = np.column_stack([rng.uniform(-17, 50, N_CONTROLS), rng.uniform(-34, 35, N_CONTROLS)])
+
+start = time.perf_counter()
+nearest = np.empty(N_CONTROLS)
+for i, j, block in repo_utils.iter_distance_blocks(controls, sites, block_size=1024):
+    nearest[i:j] = block.min(axis=1)
+brute = time.perf_counter() - start
+
+start = time.perf_counter()
+index = repo_utils.DistanceIndex(sites)
+far = index.far_from(controls, DISTANCE)
+distances, _ = index.nearest(controls)
+tree = time.perf_counter() - start
+
+start = time.perf_counter()
+matrix = repo_utils.pairwise_distances(controls[:N_MATRIX])
+full = time.perf_counter() - start
+
+print(f"{N_CONTROLS} controls against {N_SITES} sites")
+print(f"brute-force blocks:        {brute:.2f} s")
+print(f"DistanceIndex (incl. tree): {tree:.2f} s")
+print(f"same far-enough flags: {np.array_equal(far, nearest > DISTANCE)}, max nearest difference {np.abs(distances[:, 0] - nearest).max():.1e} m")
+print(f"{N_MATRIX}x{N_MATRIX} float32 matrix in blocks: {full:.2f} s, {matrix.nbytes / 1e9:.1f} GB")
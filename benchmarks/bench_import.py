@@ -0,0 +1,42 @@
+"""
+Measures interpreter start-up plus `import repo_utils`, with and without loading
+the heavier submodules, in fresh interpreters.
+
+Run from the repository root:
+    python benchmarks/bench_import.py [runs]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+CASES = {
+    "bare interpreter": "pass",
+    "import repo_utils": "import repo_utils",
+    "+ get_latest_path": "import repo_utils; repo_utils.get_latest_path",
+    "+ check_for_primary_key": "import repo_utils; repo_utils.check_for_primary_key",
+    "+ query": "import repo_utils; repo_utils.query",
+    "+ use_template": "import repo_utils; repo_utils.use_template",
+}
+
+
+def best_time(code: str) -> float:
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", code],
+            cwd=ROOT,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+for label, code in CASES.items():
+    print(f"{label:26s} {1000 * best_time(code):8.1f} ms (best of {RUNS})")
@@ -0,0 +1,63 @@
+"""
+Compares `repo_utils.radius_sweep`, which sums population over buffers with
+summed-area tables, with one `zonal_stats(stat="sum")` extraction per radius, on
+a synthetic yearly population raster at WorldPop's 100 m resolution.
+
+Run from the repository root:
+    python benchmarks/bench_integral.py [n_sites] [n_years]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import geopandas as gpd
+
+import repo_utils
+
+N_SITES = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+N_YEARS = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+RADII = (500, 1000, 2000, 5000)
+# Roughly Sierra Leone at WorldPop's 3 arc-second resolution
+TRANSFORM = (1 / 1200, 0, -13.5, 0, -1 / 1200, 10.0)
+HEIGHT, WIDTH = 3000, 3300
+
+rng = np.random.default_rng(0)
+# Clustered population: smooth settlement density times noisy pixel counts
+density = np.kron(rng.gamma(0.3, 20.0, (HEIGHT // 30, WIDTH // 30)), np.ones((30, 30)))
+data = np.stack(
+    [(density * rng.gamma(2.0, 0.5, (HEIGHT, WIDTH)) * 1.03**t).astype(np.float32) for t in range(N_YEARS)]
+)
+labels = [str(2010 + t) for t in range(N_YEARS)]
+sites = gpd.GeoDataFrame(
+    geometry=gpd.points_from_xy(rng.uniform(-13.2, -10.8, N_SITES), rng.uniform(7.7, 9.7, N_SITES)),
+    crs="EPSG:4326",
+)
+stack = repo_utils.RasterStack(data, TRANSFORM, labels=labels)
+
+start = time.perf_counter()
+reference = {
+    radius: repo_utils.zonal_stats(sites, stack, stat="sum", radius=radius)[labels].to_numpy()
+    for radius in RADII
+}
+exact = time.perf_counter() - start
+
+integral = repo_utils.IntegralImage(stack)
+start = time.perf_counter()
+repo_utils.radius_sweep(sites, stack, RADII, integral=integral)
+first = time.perf_counter() - start
+start = time.perf_counter()
+sweep = repo_utils.radius_sweep(sites, stack, RADII, integral=integral)
+again = time.perf_counter() - start
+
+print(f"{N_SITES} sites x {len(RADII)} radii x {N_YEARS} years on a {HEIGHT}x{WIDTH} grid")
+print(f"zonal_stats per radius:        {exact:.2f} s")
+print(f"radius_sweep, building tables: {first:.2f} s")
+print(f"radius_sweep, tables built:    {again:.2f} s")
+for radius in RADII:
+    values = sweep[sweep["radius"] == radius]["value"].to_numpy().reshape(N_SITES, N_YEARS)
+    error = np.abs(values - reference[radius]) / np.maximum(reference[radius], 1e-9)
+    print(f"  {radius:>5} m: median relative error {np.median(error):.2e}, 99th percentile {np.quantile(error, 0.99):.2e}")
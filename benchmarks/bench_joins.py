@@ -0,0 +1,76 @@
+"""
+Compares `repo_utils.CellIndex`, which joins sites to the OE grid cells with bulk
+STR tree queries, with a per-site loop that tests every cell, for random sites
+over `data/oemap/grid_cells.geojson`: point-to-cell ids, then area-weighted
+overlaps of 1 km buffers.
+
+Run from the repository root:
+    python benchmarks/bench_joins.py [n_sites]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+import repo_utils
+
+N_SITES = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+def per_site_join(cells, ids, points, buffers):
+    cell_ids, overlaps = [], []
+    for i, (point, buffer) in enumerate(zip(points, buffers)):
+        hits = np.flatnonzero(shapely.intersects(cells, point))
+        cell_ids.append(ids[hits[0]] if len(hits) else None)
+        for j in np.flatnonzero(shapely.intersects(cells, buffer)):
+            area = shapely.area(shapely.intersection(buffer, cells[j]))
+            if area > 0:
+                overlaps.append((i, ids[j], area / shapely.area(buffer)))
+    return cell_ids, overlaps
+
+
+path = os.path.join("data", "oemap", "grid_cells.geojson")
+cells = gpd.read_file(path)
+rng = np.random.default_rng(0)
+# Sites inside random cells, so most of them fall in one
+centres = shapely.centroid(np.asarray(cells.geometry))
+picked = rng.integers(0, len(centres), N_SITES)
+sites = gpd.GeoDataFrame(
+    geometry=gpd.points_from_xy(
+        shapely.get_x(centres[picked]) + rng.uniform(-0.02, 0.02, N_SITES),
+        shapely.get_y(centres[picked]) + rng.uniform(-0.02, 0.02, N_SITES),
+    ),
+    crs="EPSG:4326",
+)
+buffers = repo_utils.buffer_points(sites.geometry, 1000)
+
+start = time.perf_counter()
+index = repo_utils.cell_index(path)
+build = time.perf_counter() - start
+start = time.perf_counter()
+ids = index.assign(sites)
+overlaps = index.overlaps(buffers)
+bulk = time.perf_counter() - start
+start = time.perf_counter()
+repo_utils.cell_index(path).overlaps(repo_utils.buffer_points(sites.geometry, 2000))
+again = time.perf_counter() - start
+
+start = time.perf_counter()
+loop_ids, loop_overlaps = per_site_join(index.geometries, index.ids, np.asarray(sites.geometry), buffers)
+loop = time.perf_counter() - start
+
+same_ids = np.mean([(a == b) or (b is None and a != a) for a, b in zip(ids, loop_ids)])
+expected = {(i, cell): weight for i, cell, weight in loop_overlaps}
+errors = [abs(expected[(i, cell)] - weight) for i, cell, weight in overlaps[["site", "grid_cell_id", "weight"]].itertuples(index=False)]
+print(f"{N_SITES} sites over {len(cells)} grid cells")
+print(f"per-site loop:              {loop:.2f} s")
+print(f"CellIndex, building tree:   {build:.2f} s")
+print(f"CellIndex, ids + overlaps:  {bulk:.2f} s")
+print(f"cached tree, 2 km overlaps: {again:.2f} s")
+print(f"same cell ids: {same_ids:.1%}, same overlap pairs: {len(expected) == len(overlaps)}, max weight difference {max(errors):.1e}")
@@ -0,0 +1,103 @@
+"""
+Compares `repo_utils.count_osm_features`, which reads an OSM extract once and
+counts every hexagon's features with one bulk join, with the per-hexagon loop
+of `run_buildings_df` in `examples/Buildings.py` (run offline here, on features
+already in memory, so without its Overpass round-trips), on a synthetic extract.
+
+Run from the repository root:
+    python benchmarks/bench_osm.py [n_roads] [n_buildings] [hexagon_size_degrees]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyogrio
+import shapely
+
+import repo_utils
+
+N_ROADS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+N_BUILDINGS = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+HEX_SIZE = float(sys.argv[3]) if len(sys.argv) > 3 else 0.01
+EXTENT = 0.5
+HIGHWAYS = ["residential", "service", "unclassified", "secondary", "tertiary", "path", "trunk", "trunk_link", "primary"]
+BUILDINGS = ["yes", "house", "commercial", "industrial", "hotel", "apartments", "retail", "school", "church"]
+# GDAL's default node index expects real extracts; small synthetic files need the plain one
+pyogrio.set_gdal_config_options({"OSM_USE_CUSTOM_INDEXING": "NO"})
+
+
+def write_extract(path, rng):
+    node = way = 0
+    ways = []
+    with open(path, "w") as file:
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+
+        def add_node(x, y):
+            nonlocal node
+            node += 1
+            file.write(f'<node id="{node}" version="1" lat="{y:.7f}" lon="{x:.7f}"/>\n')
+            return node
+
+        for _ in range(N_ROADS):
+            points = np.cumsum(np.vstack([rng.uniform(0, EXTENT, 2), rng.normal(0, 0.003, (3, 2))]), axis=0)
+            ways.append(([add_node(x, y) for x, y in points], "highway", rng.choice(HIGHWAYS)))
+        for _ in range(N_BUILDINGS):
+            x, y = rng.uniform(0, EXTENT, 2)
+            corners = [add_node(x + dx, y + dy) for dx, dy in [(0, 0), (1e-4, 0), (1e-4, 1e-4), (0, 1e-4)]]
+            ways.append((corners + corners[:1], "building", rng.choice(BUILDINGS)))
+        for nodes, key, value in ways:
+            way += 1
+            refs = "".join(f'<nd ref="{n}"/>' for n in nodes)
+            file.write(f'<way id="{way}" version="1">{refs}<tag k="{key}" v="{value}"/></way>\n')
+        file.write("</osm>\n")
+
+
+def hexagon_grid():
+    width, angles = np.sqrt(3) * HEX_SIZE, np.radians(np.arange(30, 390, 60))
+    hexagons, ids = [], []
+    for row, y in enumerate(np.arange(0, EXTENT, 1.5 * HEX_SIZE)):
+        for col, x in enumerate(np.arange(0, EXTENT, width) + (width / 2 if row % 2 else 0)):
+            hexagons.append(shapely.Polygon(np.column_stack([x + HEX_SIZE * np.cos(angles), y + HEX_SIZE * np.sin(angles)])))
+            ids.append(f"{row}_{col}")
+    return gpd.GeoDataFrame({"h3": ids}, geometry=hexagons, crs="EPSG:4326")
+
+
+def per_hexagon_loop(hexagons, features):
+    df = pd.DataFrame()
+    for i, hexagon in enumerate(hexagons.geometry):
+        inside = features[shapely.intersects(np.asarray(features.geometry), hexagon)]
+        row = {"h3": hexagons["h3"].iloc[i]}
+        for key, values in repo_utils.DEFAULT_TAGS.items():
+            counts = inside[key].value_counts()
+            row.update({column: int(counts.get(value, 0)) for value, column in values.items()})
+        df = pd.concat([df, pd.DataFrame(row, index=[i])])
+    return df
+
+
+rng = np.random.default_rng(0)
+hexagons = hexagon_grid()
+with tempfile.TemporaryDirectory() as folder:
+    path = os.path.join(folder, "extract.osm")
+    write_extract(path, rng)
+
+    start = time.perf_counter()
+    counts = repo_utils.count_osm_features(path, hexagons)
+    bulk = time.perf_counter() - start
+
+    features = repo_utils.read_osm_features(path, {key: list(values) for key, values in repo_utils.DEFAULT_TAGS.items()})
+    start = time.perf_counter()
+    loop = per_hexagon_loop(hexagons, features)
+    looped = time.perf_counter() - start
+
+same = (loop.drop(columns="h3").to_numpy() == counts[loop.columns.drop("h3")].to_numpy()).all()
+print(f"{len(hexagons)} hexagons, {N_ROADS} roads and {N_BUILDINGS} buildings")
+print(f"per-hexagon loop (features in memory): {looped:.2f} s")
+print(f"count_osm_features (incl. reading):    {bulk:.2f} s")
+print(f"same counts: {same}")
@@ -0,0 +1,69 @@
+"""
+Compares the wide GeoJSON written by the extraction notebooks with a
+`repo_utils.PanelStore` dataset: size on disk, and the time to get a long
+(site, date, value) frame, which for the GeoJSON means reading, melting and
+parsing dates out of the column names.
+
+Run from the repository root:
+    python benchmarks/bench_panel.py [n_sites] [n_months]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+import repo_utils
+
+N_SITES = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+N_MONTHS = int(sys.argv[2]) if len(sys.argv) > 2 else 132
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+rng = np.random.default_rng(0)
+labels = [f"{2014 + m // 12}{m % 12 + 1:02d}01" for m in range(N_MONTHS)]
+gdf = gpd.GeoDataFrame(
+    {
+        "type": rng.choice(["ocean", "desert", "jungle", "rural", "built"], N_SITES),
+        "country": rng.choice(["SLE", "NGA", "KEN", "TZA"], N_SITES),
+    },
+    geometry=gpd.points_from_xy(rng.uniform(-17, 40, N_SITES), rng.uniform(-30, 15, N_SITES)),
+    crs="EPSG:4326",
+)
+gdf = pd.concat([gdf, pd.DataFrame(rng.gamma(0.5, 1.0, (N_SITES, N_MONTHS)), columns=labels)], axis=1)
+
+with tempfile.TemporaryDirectory() as folder:
+    geojson = os.path.join(folder, "nightlights.geojson")
+    gdf.to_file(geojson, driver="GeoJSON")
+    store = repo_utils.PanelStore(os.path.join(folder, "store"))
+    store.write("nightlights", gdf)
+
+    start = time.perf_counter()
+    wide = gpd.read_file(geojson)
+    melted = wide.melt(id_vars=["type", "country", "geometry"], var_name="date", value_name="value")
+    melted["date"] = pd.to_datetime(melted["date"].str.extract(r"(\d{8})")[0], format="%Y%m%d")
+    geojson_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    long = store.read(datasets=["nightlights"], add_date=True)
+    panel_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    subset = store.read(datasets=["nightlights"], types=["ocean"], countries=["SLE"], start="2020-01-01", end="2020-12-01")
+    filtered_time = time.perf_counter() - start
+
+    assert len(long) == len(melted)
+    geojson_size, panel_size = os.path.getsize(geojson), folder_size(store.root)
+    print(f"{N_SITES} sites x {N_MONTHS} months")
+    print(f"wide GeoJSON: {geojson_size / 1e6:7.1f} MB, read + melt {geojson_time:6.2f} s")
+    print(f"panel store:  {panel_size / 1e6:7.1f} MB ({geojson_size / panel_size:.1f}x smaller), read {panel_time:6.2f} s ({geojson_time / panel_time:.1f}x)")
+    print(f"filtered read of {len(subset)} rows (one type, country and year): {filtered_time:6.3f} s")
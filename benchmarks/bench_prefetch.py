@@ -0,0 +1,32 @@
+"""
+Compares serial and prefetched cursor reads in `repo_utils.sql_to_df` against
+the local fake Elasticsearch client with injected latency.
+
+Run from the repository root:
+    python benchmarks/bench_prefetch.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import repo_utils
+from fake_es import FakeElasticsearch, synthetic_hourly_rows
+
+N_ROWS = 200_000
+LATENCY = 0.02
+
+rows = synthetic_hourly_rows(N_ROWS)
+reference = None
+for depth in [0, 1, 2, 4, 8]:
+    cnxn = FakeElasticsearch(rows, latency=LATENCY)
+    start = time.perf_counter()
+    df = repo_utils.sql_to_df("SELECT * FROM fake", cnxn, prefetch=depth)
+    elapsed = time.perf_counter() - start
+    if reference is None:
+        reference = df
+    assert df.equals(reference), "Prefetched result differs from the serial one"
+    print(f"prefetch={depth}: {elapsed:6.2f} s for {len(df)} rows in {cnxn.requests} pages")
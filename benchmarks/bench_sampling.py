@@ -0,0 +1,50 @@
+"""
+Times regenerating a control-point pool with `repo_utils.sampling` on a
+synthetic, continent-sized WorldCover-style raster at 1 km: the 10 km built-up
+exclusion zone, then N points per stratum and country.
+
+Run from the repository root:
+    python benchmarks/bench_sampling.py [size] [n]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import repo_utils
+
+SIZE = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+N = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+# About Africa's extent at 1/120 degree
+TRANSFORM = (1 / 120, 0, -18.0, 0, -1 / 120, 37.0)
+STRATA = {
+    "rural": [10, 20, 30, 40, 60],
+    "bare": [60],
+    "jungle": [10],
+    "water": [80],
+    "built": [50],
+}
+
+rng = np.random.default_rng(0)
+landcover = rng.choice([10, 20, 30, 40, 60, 80], size=(SIZE, SIZE)).astype(np.uint8)
+rows, cols = rng.integers(0, SIZE - 3, (2, SIZE // 4))
+for r, c in zip(rows, cols):
+    landcover[r : r + 3, c : c + 3] = 50
+# 20 "countries" in a 4 x 5 grid
+zones = (np.arange(SIZE)[:, None] * 4 // SIZE * 5 + np.arange(SIZE)[None, :] * 5 // SIZE + 1).astype(np.int32)
+
+start = time.perf_counter()
+exclusion = repo_utils.built_exclusion(landcover, TRANSFORM)
+exclusion_time = time.perf_counter() - start
+
+start = time.perf_counter()
+points = repo_utils.sample_strata(landcover, TRANSFORM, STRATA, N, zones, exclusion=exclusion)
+sample_time = time.perf_counter() - start
+
+print(f"{SIZE} x {SIZE} pixels, {exclusion.mean():.1%} excluded")
+print(f"built-up exclusion: {exclusion_time:6.2f} s")
+print(f"{len(points)} points ({N} x {len(STRATA)} strata x 20 zones): {sample_time:6.2f} s")
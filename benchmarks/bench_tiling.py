@@ -0,0 +1,64 @@
+"""
+Compares extracting site series from a `repo_utils.TimeCube` in file order with
+extracting them tile batch by tile batch along a Hilbert curve (`SiteIndex`),
+with a tile cache too small to hold the whole grid. Reports the cache hit rate
+and time of each.
+
+Run from the repository root:
+    python benchmarks/bench_tiling.py [n_sites] [cache_tiles]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import geopandas as gpd
+
+import repo_utils
+
+N_SITES = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+CACHE_TILES = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+N_MONTHS = 24
+BATCH_SIZE = 100
+TRANSFORM = (1 / 240, 0, -13.5, 0, -1 / 240, 10.0)
+HEIGHT, WIDTH = 1024, 1024
+
+rng = np.random.default_rng(0)
+sites = gpd.GeoDataFrame(
+    geometry=gpd.points_from_xy(
+        rng.uniform(-13.4, -9.3, N_SITES), rng.uniform(5.9, 9.9, N_SITES)
+    ),
+    crs="EPSG:4326",
+)
+labels = [f"{2014 + m // 12}{m % 12 + 1:02d}01" for m in range(N_MONTHS)]
+
+with tempfile.TemporaryDirectory() as folder:
+    cube = repo_utils.TimeCube.create(folder, TRANSFORM, (HEIGHT, WIDTH), tile_size=128)
+    cube.append(rng.gamma(0.5, 1.0, (N_MONTHS, HEIGHT, WIDTH)).astype(np.float32), labels)
+
+    results = {}
+    for name, index in [
+        ("file order", None),
+        ("Hilbert tiles", repo_utils.SiteIndex(sites, TRANSFORM, tile_size=128)),
+    ]:
+        cube = repo_utils.TimeCube(folder, cache_tiles=CACHE_TILES)
+        backend = repo_utils.LocalBackend(cube)
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as checkpoints:
+            results[name] = repo_utils.run_extraction(
+                sites, backend, checkpoints, batch_size=BATCH_SIZE, max_workers=1, index=index
+            )
+        elapsed = time.perf_counter() - start
+        info = cube.cache_info()
+        print(
+            f"{name:14s} {elapsed:6.2f} s, {info['misses']:6d} tile loads, hit rate {info['hit_rate']:.1%}"
+        )
+
+np.testing.assert_allclose(
+    results["file order"][labels].to_numpy(), results["Hilbert tiles"][labels].to_numpy()
+)
+print(f"{N_SITES} sites, batches of {BATCH_SIZE}, {CACHE_TILES}-tile cache")
@@ -0,0 +1,71 @@
+"""
+Compares `repo_utils.zonal_stats`, which builds sparse coverage weights once and
+reduces every block of months with one sparse product, with a per-site loop that
+clips each buffer against its pixel window and averages month by month, on a
+synthetic monthly raster stack.
+
+Run from the repository root:
+    python benchmarks/bench_zonal.py [n_sites] [n_months]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import geopandas as gpd
+import shapely
+
+import repo_utils
+
+N_SITES = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+N_MONTHS = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+# Roughly Sierra Leone at the VIIRS monthly resolution
+TRANSFORM = (1 / 240, 0, -13.5, 0, -1 / 240, 10.0)
+HEIGHT, WIDTH = 720, 840
+
+
+def per_site_means(zones, data, transform):
+    a, _, c, _, e, f = transform
+    out = np.full((len(zones), data.shape[0]), np.nan)
+    for i, zone in enumerate(zones):
+        minx, miny, maxx, maxy = zone.bounds
+        c0, c1 = int(np.floor((minx - c) / a)), int(np.ceil((maxx - c) / a))
+        r0, r1 = int(np.floor((maxy - f) / e)), int(np.ceil((miny - f) / e))
+        rows, cols = np.mgrid[r0:r1, c0:c1]
+        x, y = c + cols.ravel() * a, f + rows.ravel() * e
+        boxes = shapely.box(x, y + e, x + a, y)
+        weights = shapely.area(shapely.intersection(boxes, zone)) / abs(a * e)
+        for t in range(data.shape[0]):
+            values = data[t, rows.ravel(), cols.ravel()]
+            valid = ~np.isnan(values)
+            out[i, t] = (weights[valid] * values[valid]).sum() / weights[valid].sum()
+    return out
+
+
+rng = np.random.default_rng(0)
+data = rng.gamma(0.5, 1.0, (N_MONTHS, HEIGHT, WIDTH)).astype(np.float32)
+labels = [f"{2014 + m // 12}{m % 12 + 1:02d}01" for m in range(N_MONTHS)]
+sites = gpd.GeoDataFrame(
+    geometry=gpd.points_from_xy(
+        rng.uniform(-13.2, -10.8, N_SITES), rng.uniform(7.3, 9.7, N_SITES)
+    ),
+    crs="EPSG:4326",
+)
+stack = repo_utils.RasterStack(data, TRANSFORM, labels=labels)
+
+start = time.perf_counter()
+zones = repo_utils.buffer_points(sites.geometry, 1000)
+loop = per_site_means(zones, data, TRANSFORM)
+loop_time = time.perf_counter() - start
+
+start = time.perf_counter()
+sparse = repo_utils.zonal_stats(sites, stack)[labels].to_numpy()
+sparse_time = time.perf_counter() - start
+
+np.testing.assert_allclose(loop, sparse, rtol=1e-6)
+print(f"{N_SITES} sites x {N_MONTHS} months, 1 km buffers")
+print(f"per-site loop:  {loop_time:6.2f} s")
+print(f"sparse weights: {sparse_time:6.2f} s ({loop_time / sparse_time:.1f}x)")
@@ -0,0 +1,105 @@
+"""
+A local stand-in for the Odyssey Elasticsearch SQL API, used to benchmark and
+check `repo_utils` without credentials or network access.
+
+It serves a synthetic hourly table one cursor page at a time, with an optional
+sleep on every request to mimic network latency.
+"""
+
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import numpy as np
+
+
+def synthetic_hourly_rows(n_rows: int, n_sites: int = 50, seed: int = 0) -> List[list]:
+    """Builds rows shaped like a GROUP BY over the hourly meter table
+
+    Args:
+        n_rows (int): Number of rows to generate
+        n_sites (int, optional): Number of distinct site names. Defaults to 50.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        List[list]: Rows of [site_name, timestamp, meter_count, consump_kwh, revenue_lc]
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    sites = [f"site_{i:03d}" for i in range(n_sites)]
+    site_idx = rng.integers(0, n_sites, n_rows)
+    hours = rng.integers(0, 24 * 365, n_rows)
+    meters = rng.integers(1, 400, n_rows)
+    kwh = rng.gamma(2.0, 5.0, n_rows)
+    revenue = kwh * rng.uniform(0.5, 1.5, n_rows)
+    return [
+        [
+            sites[site_idx[i]],
+            (start + timedelta(hours=int(hours[i]))).isoformat(timespec="milliseconds").replace("+00:00", "Z"),
+            int(meters[i]),
+            float(kwh[i]),
+            float(revenue[i]),
+        ]
+        for i in range(n_rows)
+    ]
+
+
+HOURLY_COLUMNS = [
+    {"name": "site_name", "type": "keyword"},
+    {"name": "timestamp", "type": "datetime"},
+    {"name": "meter_count", "type": "integer"},
+    {"name": "consump_kwh", "type": "double"},
+    {"name": "revenue_lc", "type": "double"},
+]
+
+
+class _FakeSqlClient:
+    def __init__(self, parent):
+        self._parent = parent
+
+    def query(self, body: dict) -> dict:
+        return self._parent._serve(body)
+
+
+class FakeElasticsearch:
+    """Serves fixed rows through the `sql.query(body=...)` cursor protocol
+
+    Args:
+        rows (List[list]): All rows of the result
+        columns (Optional[List[dict]], optional): Column metadata as returned by
+        Elasticsearch. Defaults to `HOURLY_COLUMNS`.
+        page_size (int, optional): Rows per cursor page. Defaults to 1000, like Odyssey.
+        latency (float, optional): Seconds to sleep on every request. Defaults to 0.
+    """
+
+    def __init__(
+        self,
+        rows: List[list],
+        columns: Optional[List[dict]] = None,
+        page_size: int = 1000,
+        latency: float = 0.0,
+    ):
+        self.rows = rows
+        self.columns = HOURLY_COLUMNS if columns is None else columns
+        self.page_size = page_size
+        self.latency = latency
+        self.requests = 0
+        self.queries = []
+        self.sql = _FakeSqlClient(self)
+
+    def _serve(self, body: dict) -> dict:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if "query" in body:
+            self.queries.append(body["query"])
+            start = 0
+        else:
+            start = int(body["cursor"])
+        end = start + self.page_size
+        response = {"rows": self.rows[start:end]}
+        if start == 0:
+            response["columns"] = self.columns
+        if end < len(self.rows):
+            response["cursor"] = str(end)
+        return response
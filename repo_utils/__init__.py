@@ -0,0 +1,156 @@
+"""
+repo_utils: useful code shared by the notebooks throughout this project
+
+Importing the package is cheap: only the path helpers are loaded up front. The
+heavier features live in submodules that are imported on first use of any of
+their names, so `repo_utils.query` loads pandas and the Odyssey clients, and
+`repo_utils.use_template` loads Plotly. Calling `use_template()` sets the CB
+figure template as the Plotly default; nothing changes Plotly's default on import.
+
+    - `paths`: typical file names and directory paths
+    - `odyssey`: querying Odyssey and parsing its data dictionary
+    - `quality`: data-quality checks, such as primary keys
+    - `plotting`: Plotly template, graph and text color palettes
+    - `catalog`: an indexed catalog of dataset artifacts and their versions
+    - `zonal`: local zonal statistics of raster stacks over site buffers
+    - `cube`: a tiled, memory-mapped store of monthly rasters
+    - `extraction`: batched, concurrent and resumable zonal extractions
+    - `tiling`: space-filling-curve ordering and tile batches for site sets
+    - `panel`: a long-format Parquet store for extraction results
+    - `sampling`: local stratified sampling of dark-area control points
+    - `streaming`: running means and quantile sketches over extraction chunks
+    - `integral`: summed-area tables for fast buffer-radius sweeps
+    - `hrea`: windowed, concurrent reads of HREA rasters around sites
+    - `joins`: bulk spatial joins of sites and buffers to grid cells
+    - `buffers`: metric buffers of lon/lat geometries, projected by group
+    - `distances`: bulk great-circle distances, nearest sites and clusters
+    - `osm`: offline counts of OpenStreetMap features per hexagon
+"""
+
+import importlib
+
+from .paths import get_latest_path, project_root
+
+# Which submodule provides each lazily loaded name
+_LAZY_NAMES = {
+    "odyssey": [
+        "load_metadata",
+        "create_connection",
+        "get_connection",
+        "close_connections",
+        "list_all_tables",
+        "list_all_columns",
+        "TableDictionary",
+        "DataDictionary",
+        "get_data_dictionary",
+        "get_useful_columns",
+        "iter_sql_to_df",
+        "sql_to_df",
+        "parse_to_sql",
+        "QueryCache",
+        "QUERY_CACHE",
+        "query",
+        "INCREMENTAL_STORE",
+        "refresh_query",
+        "make_partitions",
+        "get_year_month_col",
+    ],
+    "quality": [
+        "check_for_primary_key",
+        "check_for_functional_dependency",
+        "profile_primary_key",
+        "profile_functional_dependency",
+        "find_candidate_keys",
+    ],
+    "catalog": [
+        "ArtifactCatalog",
+    ],
+    "zonal": [
+        "RasterStack",
+        "CoverageWeights",
+        "coverage_weights",
+        "buffer_points",
+        "zonal_stats",
+    ],
+    "cube": [
+        "TimeCube",
+    ],
+    "extraction": [
+        "EarthEngineBackend",
+        "LocalBackend",
+        "run_extraction",
+    ],
+    "tiling": [
+        "SiteIndex",
+        "hilbert_keys",
+        "morton_keys",
+    ],
+    "panel": [
+        "PanelStore",
+        "wide_to_long",
+        "month_code",
+    ],
+    "sampling": [
+        "built_exclusion",
+        "rasterize_zones",
+        "sample_strata",
+    ],
+    "streaming": [
+        "QuantileSketch",
+        "StreamingSummary",
+    ],
+    "integral": [
+        "IntegralImage",
+        "radius_sweep",
+    ],
+    "hrea": [
+        "HreaIndex",
+    ],
+    "joins": [
+        "CellIndex",
+        "cell_index",
+    ],
+    "buffers": [
+        "metric_buffer",
+    ],
+    "distances": [
+        "DistanceIndex",
+        "haversine",
+        "iter_distance_blocks",
+        "pairwise_distances",
+    ],
+    "osm": [
+        "DEFAULT_TAGS",
+        "read_osm_features",
+        "count_features",
+        "count_osm_features",
+    ],
+    "plotting": [
+        "graphs_palette",
+        "text_palette",
+        "text_font",
+        "use_template",
+    ],
+}
+_LAZY_SUBMODULES = {"paths"} | set(_LAZY_NAMES)
+_NAME_TO_SUBMODULE = {
+    name: submodule for submodule, names in _LAZY_NAMES.items() for name in names
+}
+
+__all__ = ["get_latest_path", "project_root"] + list(_NAME_TO_SUBMODULE)
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name not in _NAME_TO_SUBMODULE:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    submodule = importlib.import_module(f".{_NAME_TO_SUBMODULE[name]}", __name__)
+    value = getattr(submodule, name)
+    # Cache on the package, so later lookups skip this function entirely
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | _LAZY_SUBMODULES)
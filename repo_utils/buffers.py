@@ -0,0 +1,101 @@
+"""
+buffers: metric buffers of lon/lat geometries, projected a group at a time
+
+`examples/Buildings.py` buffers each site by projecting it on its own with
+`shapely.ops.transform(partial(pyproj.transform, ...))`, which builds a new
+transformer per geometry and is very slow across a continent. `metric_buffer()`
+groups the geometries by projection instead, either by UTM zone or by small
+clusters that share a local azimuthal equidistant projection. It then projects,
+buffers and projects back each group with one cached transformer and
+vectorized shapely operations.
+
+A local azimuthal equidistant projection is exact at its centre, and its
+distances are off by about (d / R)**2 / 6 at a distance d from it. In clusters
+of 2 degrees that is at most a few parts in 10,000, less than the 0.04-0.1%
+scale error of UTM. Both are well below the error of `zonal.buffer_points()`,
+which stretches circles in degrees by 1 / cos(latitude).
+"""
+
+import functools
+import warnings
+import numpy as np
+import pandas as pd
+import shapely
+from typing import Any, Tuple
+
+try:
+    import pyproj
+except ImportError:
+    warnings.warn(
+        "The package pyproj is not found. Not the end of the world, but you cannot use repo_utils.buffers."
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _transformer(projection: str) -> Any:
+    """A transformer from lon/lat to a projection, built once per projection
+
+    Built as a PROJ pipeline rather than with `Transformer.from_crs()`, which
+    takes about a hundred times longer to set up.
+    """
+    return pyproj.Transformer.from_pipeline(
+        f"+proj=pipeline +step +proj=unitconvert +xy_in=deg +xy_out=rad +step {projection} +ellps=WGS84"
+    )
+
+
+def _apply(transformer: Any, geometries: np.ndarray, direction: str = "FORWARD") -> np.ndarray:
+    """Transforms an array of geometries with one vectorized call"""
+    return shapely.transform(
+        geometries,
+        lambda xy: np.column_stack(transformer.transform(xy[:, 0], xy[:, 1], direction=direction)),
+    )
+
+
+def metric_buffer(
+    geometries: Any,
+    distance: float,
+    method: str = "aeqd",
+    cluster_size: float = 2.0,
+    quad_segs: int = 16,
+) -> np.ndarray:
+    """Buffers lon/lat geometries by a distance in metres
+
+    Args:
+        geometries (Any): Geometries in EPSG:4326, as a GeoSeries or array of
+        shapely geometries
+        distance (float): The buffer distance, in metres
+        method (str, optional): "aeqd" to project each cluster of `cluster_size`
+        degrees around its centre, or "utm" to project each UTM zone. Defaults to
+        "aeqd".
+        cluster_size (float, optional): The side of the "aeqd" clusters, in
+        degrees. Defaults to 2.0.
+        quad_segs (int, optional): Segments per quarter circle. Defaults to 16.
+
+    Returns:
+        np.ndarray: The buffers, in EPSG:4326
+    """
+    if method not in ("aeqd", "utm"):
+        raise ValueError(f"Unknown method {method!r}, expected 'aeqd' or 'utm'.")
+    geometries = np.asarray(geometries)
+    centres = shapely.centroid(geometries)
+    lon, lat = shapely.get_x(centres), shapely.get_y(centres)
+    if method == "utm":
+        zone = np.clip(np.floor((lon + 180) / 6).astype(int) + 1, 1, 60)
+        groups = pd.Series([f"+proj=utm +zone={z}" + (" +south" if y < 0 else "") for z, y in zip(zone, lat)])
+    else:
+        # Each cluster is projected around the centre of its cell of the grid
+        col = np.floor(lon / cluster_size)
+        row = np.floor(lat / cluster_size)
+        groups = pd.Series(
+            [
+                f"+proj=aeqd +lat_0={(r + 0.5) * cluster_size:g} +lon_0={(c + 0.5) * cluster_size:g}"
+                for r, c in zip(row, col)
+            ]
+        )
+
+    out = np.empty(len(geometries), dtype=object)
+    for projection, members in groups.groupby(groups, sort=False).indices.items():
+        transformer = _transformer(projection)
+        projected = shapely.buffer(_apply(transformer, geometries[members]), distance, quad_segs=quad_segs)
+        out[members] = _apply(transformer, projected, direction="INVERSE")
+    return out
@@ -0,0 +1,341 @@
+"""
+catalog: an indexed catalog of the dataset artifacts written by the notebooks
+
+Every artifact (a CSV, GeoJSON, RDS, Parquet... file) is recorded in a JSON
+manifest with its logical name, version, content hash, schema and format. The
+manifest keeps a pointer to the latest version of each logical name, so finding
+it is a dictionary lookup instead of a directory listing, and it remembers the
+input hashes each derived artifact was built from, so that a step can be skipped
+when none of its inputs have changed.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+# Leading version stamps in file names, e.g. "230115_sites.csv" or "20230115-sites.csv"
+_VERSION_PREFIX = re.compile(r"^(\d{6}|\d{8})[_\-]?")
+
+# Multi-part extensions come first, so that ".geo.json" is not read as ".json"
+_FORMATS = [
+    (".geo.json", "geojson"),
+    (".geojson", "geojson"),
+    (".csv", "csv"),
+    (".parquet", "parquet"),
+    (".rds", "rds"),
+    (".json", "json"),
+    (".shp", "shapefile"),
+    (".tif", "geotiff"),
+    (".tiff", "geotiff"),
+    (".xlsx", "excel"),
+]
+
+# GeoJSON files above this size are not parsed just to record their schema
+_MAX_SCHEMA_BYTES = 50 * 1024**2
+
+
+def split_artifact_name(path: str) -> tuple:
+    """Splits a file name into its logical name, version and format
+
+    Args:
+        path (str): The path to the file
+
+    Returns:
+        tuple: (name, version, format). The version is the file's leading date
+        stamp, or None if it has none. Unknown extensions give the extension
+        itself, without the dot, as the format.
+    """
+    basename = os.path.basename(path)
+    for extension, file_format in _FORMATS:
+        if basename.lower().endswith(extension):
+            stem = basename[: -len(extension)]
+            break
+    else:
+        stem, extension = os.path.splitext(basename)
+        file_format = extension.lstrip(".").lower()
+
+    match = _VERSION_PREFIX.match(stem)
+    if match and len(stem) > match.end():
+        return stem[match.end() :], match.group(1), file_format
+    return stem, None, file_format
+
+
+def _version_key(version: str) -> str:
+    """Makes a version comparable with others, whatever its date format
+
+    Six-digit YYMMDD stamps are widened to YYYYMMDD (taken as 20YY), so that
+    "230115" sorts before "20240101" as the dates they stand for. Other
+    versions are compared as they are.
+    """
+    if len(version) == 6 and version.isdigit():
+        return "20" + version
+    return version
+
+
+def file_hash(path: str, block_size: int = 1024**2) -> str:
+    """Returns the SHA-256 of a file's contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_schema(path: str, file_format: str) -> Optional[List[str]]:
+    """Lists the columns of a tabular artifact, or None if they are unknown"""
+    try:
+        if file_format == "csv":
+            with open(path, newline="") as file:
+                return next(csv.reader(file), [])
+        if file_format == "parquet":
+            import pyarrow.parquet as pq
+
+            return list(pq.read_schema(path).names)
+        if file_format == "geojson" and os.path.getsize(path) <= _MAX_SCHEMA_BYTES:
+            with open(path) as file:
+                features = json.load(file).get("features", [])
+            return list(features[0]["properties"]) if features else []
+    except (OSError, ValueError, KeyError, ImportError):
+        pass
+    return None
+
+
+class ArtifactCatalog:
+    """A manifest-backed index of dataset artifacts under a root folder
+
+    Args:
+        root (str): The folder the artifacts live in. Paths in the manifest are
+        stored relative to it.
+        manifest (str, optional): The manifest's file name inside `root`.
+        Defaults to "catalog.json".
+    """
+
+    def __init__(self, root: str, manifest: str = "catalog.json"):
+        self.root = os.path.abspath(root)
+        self.manifest_path = os.path.join(self.root, manifest)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as file:
+                manifest_data = json.load(file)
+        else:
+            manifest_data = {}
+        # artifacts: relative path -> record; latest: name -> format -> relative path
+        self.artifacts = manifest_data.get("artifacts", {})
+        self.latest_paths = manifest_data.get("latest", {})
+
+    def save(self):
+        """Writes the manifest, via a temporary file so it is never half-written"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.manifest_path + ".tmp", "w") as file:
+            json.dump(
+                {"artifacts": self.artifacts, "latest": self.latest_paths},
+                file,
+                indent=1,
+                sort_keys=True,
+            )
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def _relative(self, path: str) -> str:
+        if not os.path.isabs(path) and not os.path.exists(path):
+            path = os.path.join(self.root, path)
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def _absolute(self, relative: str) -> str:
+        return os.path.join(self.root, *relative.split("/"))
+
+    def _sort_key(self, relative: str, record: Optional[dict] = None) -> tuple:
+        """Orders the versions of an artifact: by date, then by path"""
+        record = self.artifacts[relative] if record is None else record
+        return _version_key(record["version"]), relative
+
+    def current_hash(self, path: str) -> str:
+        """Returns a file's content hash, re-hashing only if its size or mtime changed"""
+        relative = self._relative(path)
+        stat = os.stat(self._absolute(relative))
+        record = self.artifacts.get(relative)
+        if record is not None and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime:
+            return record["hash"]
+        return file_hash(self._absolute(relative))
+
+    def register(
+        self,
+        path: str,
+        name: Optional[str] = None,
+        version: Optional[str] = None,
+        inputs: Optional[List[str]] = None,
+        save: bool = True,
+    ) -> dict:
+        """Records an artifact in the catalog and updates the latest pointers
+
+        Args:
+            path (str): Path to the artifact, absolute or relative to the root
+            name (Optional[str], optional): Its logical name. Defaults to None,
+            which takes it from the file name.
+            version (Optional[str], optional): Its version. Defaults to None, which
+            takes the file name's date stamp or, failing that, its modification date.
+            inputs (Optional[List[str]], optional): Paths of the artifacts this one
+            was derived from. Their current hashes are recorded, for `is_up_to_date()`.
+            save (bool, optional): Whether to write the manifest straight away.
+            Defaults to True; set False when registering many files at once.
+
+        Returns:
+            dict: The artifact's record
+        """
+        relative = self._relative(path)
+        absolute = self._absolute(relative)
+        parsed_name, parsed_version, file_format = split_artifact_name(relative)
+        stat = os.stat(absolute)
+        if version is None:
+            version = parsed_version or time.strftime("%Y%m%d", time.localtime(stat.st_mtime))
+
+        previous = self.artifacts.get(relative)
+        unchanged = (
+            previous is not None
+            and previous["size"] == stat.st_size
+            and previous["mtime"] == stat.st_mtime
+        )
+        record = {
+            "name": name or parsed_name,
+            "version": version,
+            "format": file_format,
+            "hash": self.current_hash(relative),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "schema": previous["schema"] if unchanged else _read_schema(absolute, file_format),
+        }
+        if inputs is not None:
+            record["inputs"] = {self._relative(x): self.current_hash(x) for x in inputs}
+        elif unchanged and "inputs" in previous:
+            record["inputs"] = previous["inputs"]
+        self.artifacts[relative] = record
+
+        formats = self.latest_paths.setdefault(record["name"], {})
+        current = formats.get(file_format)
+        # The latest date wins, then the name
+        if current is None or current not in self.artifacts or (
+            self._sort_key(relative, record) >= self._sort_key(current)
+        ):
+            formats[file_format] = relative
+        if save:
+            self.save()
+        return record
+
+    def scan(self, folder: Optional[str] = None, recursive: bool = True) -> int:
+        """Registers every file in a folder, re-hashing only files that changed
+
+        Args:
+            folder (Optional[str], optional): The folder to scan. Defaults to None,
+            which scans the whole root.
+            recursive (bool, optional): Whether to descend into subfolders.
+            Defaults to True.
+
+        Returns:
+            int: The number of files registered
+        """
+        folder = self.root if folder is None else os.path.join(self.root, folder)
+        count = 0
+        for dirpath, dirnames, filenames in os.walk(folder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.abspath(path) in [self.manifest_path, self.manifest_path + ".tmp"]:
+                    continue
+                self.register(path, save=False)
+                count += 1
+            if not recursive:
+                break
+        # Forget files that have been deleted since they were registered
+        for relative in list(self.artifacts):
+            if not os.path.exists(self._absolute(relative)):
+                self.remove(relative, save=False)
+        self.save()
+        return count
+
+    def remove(self, path: str, save: bool = True):
+        """Forgets an artifact, pointing its name's latest entry at the next newest"""
+        relative = self._relative(path) if os.path.isabs(path) else path
+        record = self.artifacts.pop(relative, None)
+        if record is None:
+            return
+        formats = self.latest_paths.get(record["name"], {})
+        if formats.get(record["format"]) == relative:
+            remaining = [
+                self._sort_key(key)
+                for key, x in self.artifacts.items()
+                if x["name"] == record["name"] and x["format"] == record["format"]
+            ]
+            if remaining:
+                formats[record["format"]] = max(remaining)[1]
+            else:
+                del formats[record["format"]]
+        if save:
+            self.save()
+
+    def latest(self, name: str, format: Optional[str] = None, folder: Optional[str] = None) -> str:
+        """Returns the path of the latest version of an artifact
+
+        Args:
+            name (str): The artifact's logical name, e.g. "nighttime_cluber_gdf"
+            format (Optional[str], optional): The format wanted, e.g. "csv".
+            Defaults to None, which accepts any format and returns the most
+            recent version among them.
+            folder (Optional[str], optional): Only consider versions directly in
+            this folder, absolute or relative to the root, and not those in other
+            folders or subfolders (e.g. an "archive"). Defaults to None, which
+            considers the whole catalog.
+
+        Returns:
+            str: The absolute path to the artifact
+        """
+        formats = self.latest_paths.get(name, {})
+        candidates = list(formats.values()) if format is None else [formats[format]] if format in formats else []
+        if folder is not None:
+            folder = self._relative(folder)
+            folder = "" if folder == "." else folder
+
+            def in_folder(relative):
+                return relative.rsplit("/", 1)[0] if "/" in relative else ""
+
+            # The catalog-wide latest pointers usually sit in the folder already
+            candidates = [x for x in candidates if in_folder(x) == folder]
+            if not candidates:
+                candidates = [
+                    key
+                    for key, x in self.artifacts.items()
+                    if x["name"] == name and (format is None or x["format"] == format) and in_folder(key) == folder
+                ]
+        if not candidates:
+            where = f" in {folder or 'the root folder'}" if folder is not None else ""
+            raise ValueError(f"Artifact {name} ({format or 'any format'}) not found{where} in the catalog.")
+        return self._absolute(max(candidates, key=self._sort_key))
+
+    def versions(self, name: str) -> Dict[str, dict]:
+        """Returns every recorded version of an artifact, keyed by relative path"""
+        return {key: x for key, x in self.artifacts.items() if x["name"] == name}
+
+    def is_up_to_date(self, path: str, inputs: List[str]) -> bool:
+        """Checks if an artifact was built from exactly the current inputs
+
+        Use this to skip a step: if the output is registered with the same inputs
+        and none of their hashes have changed, it does not need rebuilding.
+
+        Args:
+            path (str): Path to the derived artifact
+            inputs (List[str]): Paths of the artifacts it is built from
+
+        Returns:
+            bool: True if the output exists and its recorded input hashes match
+        """
+        relative = self._relative(path)
+        record = self.artifacts.get(relative)
+        if record is None or not os.path.exists(self._absolute(relative)):
+            return False
+        recorded = record.get("inputs")
+        if recorded is None or set(recorded) != {self._relative(x) for x in inputs}:
+            return False
+        return all(
+            os.path.exists(self._absolute(key)) and self.current_hash(key) == value
+            for key, value in recorded.items()
+        )
@@ -0,0 +1,389 @@
+"""
+cube: a tiled, memory-mapped store of monthly rasters, such as VIIRS nightlights
+
+A cube is a folder holding a (time, y, x) float32 array cut into chunks of
+`time_chunk` months by `tile_size` x `tile_size` pixels, each saved as its own
+`.npy` file and opened as a memory map. A site's whole time series is read from
+the few tiles its buffer touches, instead of from a full `toBands()` stack, and
+new months are appended by rewriting only the last chunk of months. Tiles with
+no data at all (e.g. open ocean) are not written.
+
+A `TimeCube` can be passed to `repo_utils.zonal_stats()` in place of a
+`RasterStack`, so every extraction can share the same cube on disk.
+"""
+
+import collections
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+from .zonal import _as_tuple
+
+_METADATA = "cube.json"
+
+
+def _to_label(date: Any) -> str:
+    """Turns a date, or a "YYYYMMDD" label, into a "YYYYMMDD" label"""
+    if isinstance(date, str) and len(date) == 8 and date.isdigit():
+        return date
+    return pd.Timestamp(date).strftime("%Y%m%d")
+
+
+class TimeCube:
+    """A tiled (time, y, x) float32 raster store on disk
+
+    Open an existing cube with `TimeCube(path)`, or make a new one with
+    `TimeCube.create()`.
+
+    Args:
+        path (str): The cube's folder
+        cache_tiles (int, optional): The number of tiles kept open in the LRU
+        cache. Defaults to 512.
+    """
+
+    def __init__(self, path: str, cache_tiles: int = 512):
+        self.path = path
+        with open(os.path.join(path, _METADATA)) as file:
+            metadata = json.load(file)
+        self.transform = tuple(metadata["transform"])
+        self.height = metadata["height"]
+        self.width = metadata["width"]
+        self.tile_size = metadata["tile_size"]
+        self.time_chunk = metadata["time_chunk"]
+        self.crs = metadata["crs"]
+        self.times = metadata["times"]
+        # Tiles that hold data, as "chunk/row_col" keys
+        self.stored = set(metadata["stored"])
+        self.nodata = None
+        self.cache_tiles = cache_tiles
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        transform: Sequence[float],
+        shape: tuple,
+        tile_size: int = 256,
+        time_chunk: int = 12,
+        crs: str = "EPSG:4326",
+    ) -> "TimeCube":
+        """Creates an empty cube
+
+        Args:
+            path (str): The folder to create it in
+            transform (Sequence[float]): The affine transform (a, b, c, d, e, f) of the grid
+            shape (tuple): The grid's (height, width)
+            tile_size (int, optional): Tile height and width, in pixels. Defaults to 256.
+            time_chunk (int, optional): Months per tile file. Defaults to 12.
+            crs (str, optional): The grid's CRS. Defaults to "EPSG:4326".
+
+        Returns:
+            TimeCube: The new, empty cube
+        """
+        if os.path.exists(os.path.join(path, _METADATA)):
+            raise ValueError(f"There is already a cube in {path}.")
+        os.makedirs(path, exist_ok=True)
+        metadata = {
+            "transform": list(_as_tuple(transform)),
+            "height": int(shape[0]),
+            "width": int(shape[1]),
+            "tile_size": tile_size,
+            "time_chunk": time_chunk,
+            "crs": crs,
+            "times": [],
+            "stored": [],
+        }
+        with open(os.path.join(path, _METADATA), "w") as file:
+            json.dump(metadata, file, indent=1)
+        return cls(path)
+
+    # The attributes `repo_utils.zonal_stats()` expects of a raster stack
+    @property
+    def count(self) -> int:
+        return len(self.times)
+
+    @property
+    def labels(self) -> List[str]:
+        return self.times
+
+    def _save_metadata(self):
+        metadata = {
+            "transform": list(self.transform),
+            "height": self.height,
+            "width": self.width,
+            "tile_size": self.tile_size,
+            "time_chunk": self.time_chunk,
+            "crs": self.crs,
+            "times": self.times,
+            "stored": sorted(self.stored),
+        }
+        tmp = os.path.join(self.path, _METADATA + ".tmp")
+        with open(tmp, "w") as file:
+            json.dump(metadata, file, indent=1)
+        os.replace(tmp, os.path.join(self.path, _METADATA))
+
+    @staticmethod
+    def _key(chunk: int, tile_row: int, tile_col: int) -> str:
+        return f"{chunk}/{tile_row}_{tile_col}"
+
+    def _tile_path(self, key: str) -> str:
+        return os.path.join(self.path, *key.split("/")) + ".npy"
+
+    def _tile(self, chunk: int, tile_row: int, tile_col: int) -> Optional[np.ndarray]:
+        """Returns a memory-mapped tile, or None if it holds no data"""
+        key = self._key(chunk, tile_row, tile_col)
+        if key not in self.stored:
+            return None
+        with self._cache_lock:
+            tile = self._cache.get(key)
+            if tile is not None:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return tile
+            self.misses += 1
+        tile = np.load(self._tile_path(key), mmap_mode="r")
+        with self._cache_lock:
+            self._cache[key] = tile
+            if len(self._cache) > self.cache_tiles:
+                self._cache.popitem(last=False)
+        return tile
+
+    def cache_info(self) -> dict:
+        """Returns the tile cache's hits, misses, hit rate and current size"""
+        with self._cache_lock:
+            hits, misses, tiles = self.hits, self.misses, len(self._cache)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+            "tiles": tiles,
+        }
+
+    def clear_cache(self):
+        """Drops every cached tile and resets the hit and miss counters"""
+        with self._cache_lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _write(self, get_block: Callable[[int, int, int, int], np.ndarray], times: List[str]):
+        """Appends months, reading them strip by strip from `get_block(t0, t1, r0, r1)`"""
+        times = [_to_label(x) for x in times]
+        if sorted(times) != times or len(set(times)) != len(times):
+            raise ValueError("The new months must be sorted and distinct.")
+        if self.times and times and times[0] <= self.times[-1]:
+            raise ValueError(f"The new months must come after {self.times[-1]}.")
+
+        n_old, size = len(self.times), self.tile_size
+        n_tile_cols = -(-self.width // size)
+        for chunk in range(n_old // self.time_chunk, -(-(n_old + len(times)) // self.time_chunk)):
+            # Months already in this chunk, and the new ones that go into it
+            kept = max(n_old - chunk * self.time_chunk, 0)
+            t0 = max(chunk * self.time_chunk - n_old, 0)
+            t1 = min((chunk + 1) * self.time_chunk - n_old, len(times))
+            os.makedirs(os.path.join(self.path, str(chunk)), exist_ok=True)
+            for r0 in range(0, self.height, size):
+                strip = np.asarray(get_block(t0, t1, r0, min(r0 + size, self.height)), dtype=np.float32)
+                for tile_col in range(n_tile_cols):
+                    new = strip[:, :, tile_col * size : (tile_col + 1) * size]
+                    key = self._key(chunk, r0 // size, tile_col)
+                    if kept and key in self.stored:
+                        old = np.load(self._tile_path(key))
+                    elif np.isnan(new).all():
+                        continue
+                    else:
+                        old = np.full((kept,) + new.shape[1:], np.nan, dtype=np.float32)
+                    path = self._tile_path(key)
+                    # np.save appends ".npy" to names without it
+                    np.save(path + ".tmp.npy", np.concatenate([old, new]))
+                    os.replace(path + ".tmp.npy", path)
+                    with self._cache_lock:
+                        self._cache.pop(key, None)
+                    self.stored.add(key)
+        self.times = self.times + times
+        self._save_metadata()
+
+    def append(self, data: np.ndarray, times: List[Any]):
+        """Appends new months to the cube
+
+        Args:
+            data (np.ndarray): A (months, height, width) array, or a single
+            (height, width) month, on the cube's grid. A memory map works too.
+            times (List[Any]): The date of each month, as dates or "YYYYMMDD" labels.
+            They must come after the months already stored.
+        """
+        if data.ndim == 2:
+            data = data[None]
+        if data.shape != (len(times), self.height, self.width):
+            raise ValueError(
+                f"Expected data of shape {(len(times), self.height, self.width)}, got {data.shape}."
+            )
+        self._write(lambda t0, t1, r0, r1: data[t0:t1, r0:r1], times)
+
+    def append_stack(self, stack: Any, times: Optional[List[Any]] = None):
+        """Appends every band of a `repo_utils.RasterStack`, such as an exported GeoTIFF
+
+        Args:
+            stack (Any): A `RasterStack` on the cube's grid
+            times (Optional[List[Any]], optional): The date of each band. Defaults to
+            None, which uses the stack's labels.
+        """
+        if _as_tuple(stack.transform) != self.transform or (stack.height, stack.width) != (
+            self.height,
+            self.width,
+        ):
+            raise ValueError("The stack is not on the cube's grid.")
+
+        def get_block(t0, t1, r0, r1):
+            pixels = np.arange(r0 * self.width, r1 * self.width)
+            values = stack.read_pixels(range(t0, t1), pixels)
+            return values.T.reshape(t1 - t0, r1 - r0, self.width)
+
+        self._write(get_block, stack.labels if times is None else times)
+
+    def _time_range(self, start: Optional[Any], end: Optional[Any]) -> tuple:
+        """Turns an inclusive date range into a slice of month indices"""
+        t0 = 0 if start is None else int(np.searchsorted(self.times, _to_label(start), side="left"))
+        t1 = len(self.times) if end is None else int(np.searchsorted(self.times, _to_label(end), side="right"))
+        return t0, t1
+
+    def read_window(self, t0: int, t1: int, r0: int, r1: int, c0: int, c1: int) -> np.ndarray:
+        """Reads a (months, rows, cols) block by index, with NaN where there is no data"""
+        out = np.full((t1 - t0, r1 - r0, c1 - c0), np.nan, dtype=np.float32)
+        size = self.tile_size
+        for chunk in range(t0 // self.time_chunk, -(-t1 // self.time_chunk)):
+            base = chunk * self.time_chunk
+            u0, u1 = max(t0, base), min(t1, base + self.time_chunk)
+            for tile_row in range(r0 // size, -(-r1 // size)):
+                for tile_col in range(c0 // size, -(-c1 // size)):
+                    tile = self._tile(chunk, tile_row, tile_col)
+                    if tile is None:
+                        continue
+                    y0, y1 = max(r0, tile_row * size), min(r1, (tile_row + 1) * size)
+                    x0, x1 = max(c0, tile_col * size), min(c1, (tile_col + 1) * size)
+                    out[u0 - t0 : u1 - t0, y0 - r0 : y1 - r0, x0 - c0 : x1 - c0] = tile[
+                        u0 - base : u1 - base,
+                        y0 - tile_row * size : y1 - tile_row * size,
+                        x0 - tile_col * size : x1 - tile_col * size,
+                    ]
+        return out
+
+    def read(
+        self,
+        bbox: Optional[Sequence[float]] = None,
+        geometry: Optional[Any] = None,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+    ) -> tuple:
+        """Reads the pixels covering an area over a range of months
+
+        Args:
+            bbox (Optional[Sequence[float]], optional): (minx, miny, maxx, maxy) in the
+            cube's CRS. Defaults to None.
+            geometry (Optional[Any], optional): A shapely geometry whose bounds are
+            used instead of `bbox`. Defaults to None; with neither, the whole grid is read.
+            start (Optional[Any], optional): The first month, inclusive. Defaults to None.
+            end (Optional[Any], optional): The last month, inclusive. Defaults to None.
+
+        Returns:
+            tuple: (data, transform, times), where data is a (months, rows, cols)
+            float32 array and transform is the affine transform of its top-left pixel
+        """
+        if geometry is not None:
+            bbox = geometry.bounds
+        a, _, c, _, e, f = self.transform
+        if bbox is None:
+            r0, r1, c0, c1 = 0, self.height, 0, self.width
+        else:
+            minx, miny, maxx, maxy = bbox
+            c0 = int(np.clip(np.floor((minx - c) / a), 0, self.width))
+            c1 = int(np.clip(np.ceil((maxx - c) / a), 0, self.width))
+            r0 = int(np.clip(np.floor((maxy - f) / e), 0, self.height))
+            r1 = int(np.clip(np.ceil((miny - f) / e), 0, self.height))
+        t0, t1 = self._time_range(start, end)
+        data = self.read_window(t0, t1, r0, r1, c0, c1)
+        transform = (a, 0.0, c + c0 * a, 0.0, e, f + r0 * e)
+        return data, transform, self.times[t0:t1]
+
+    def read_pixels(self, bands: Sequence[int], pixels: np.ndarray) -> np.ndarray:
+        """Reads a set of pixels from a set of months, as `RasterStack.read_pixels()`
+
+        Args:
+            bands (Sequence[int]): Zero-based month indices
+            pixels (np.ndarray): Flat (row * width + col) pixel indices
+
+        Returns:
+            np.ndarray: A float64 (pixels, months) array, with missing values as NaN
+        """
+        bands = np.asarray(list(bands), dtype=np.int64)
+        values = np.full((len(pixels), len(bands)), np.nan)
+        rows, cols = np.divmod(np.asarray(pixels, dtype=np.int64), self.width)
+        size = self.tile_size
+        tiles = (rows // size) * (self.width // size + 1) + cols // size
+        order = np.argsort(tiles, kind="stable")
+        tile_groups = np.split(order, np.flatnonzero(np.diff(tiles[order])) + 1)
+        chunks = bands // self.time_chunk
+        for chunk in np.unique(chunks):
+            positions = np.flatnonzero(chunks == chunk)
+            offsets = bands[positions] - chunk * self.time_chunk
+            for group in tile_groups:
+                if len(group) == 0:
+                    continue
+                tile_row, tile_col = rows[group[0]] // size, cols[group[0]] // size
+                tile = self._tile(int(chunk), int(tile_row), int(tile_col))
+                if tile is None:
+                    continue
+                picked = tile[:, rows[group] - tile_row * size, cols[group] - tile_col * size]
+                values[np.ix_(group, positions)] = picked[offsets].T
+        return values
+
+    def series(
+        self,
+        sites: Any,
+        radius: Optional[float] = 1000,
+        start: Optional[Any] = None,
+        end: Optional[Any] = None,
+        stat: str = "mean",
+    ) -> Union[pd.DataFrame, Any]:
+        """Computes every site's time series over a range of months
+
+        This is `repo_utils.zonal_stats()` over the cube, so it only reads the
+        tiles the sites' buffers touch.
+
+        Args:
+            sites (Any): A GeoDataFrame of sites, or their geometries
+            radius (Optional[float], optional): Buffer radius in metres. Defaults to 1000.
+            start (Optional[Any], optional): The first month, inclusive. Defaults to None.
+            end (Optional[Any], optional): The last month, inclusive. Defaults to None.
+            stat (str, optional): "mean" or "sum". Defaults to "mean".
+
+        Returns:
+            The sites with one column per month, as `zonal_stats()`
+        """
+        from .zonal import zonal_stats
+
+        t0, t1 = self._time_range(start, end)
+        return zonal_stats(sites, _TimeSlice(self, t0, t1), stat=stat, radius=radius)
+
+
+class _TimeSlice:
+    """A view of a range of a cube's months, for `zonal_stats()`"""
+
+    def __init__(self, cube: TimeCube, t0: int, t1: int):
+        self.cube = cube
+        self.t0 = t0
+        self.transform = cube.transform
+        self.height, self.width = cube.height, cube.width
+        self.labels = cube.times[t0:t1]
+        self.count = len(self.labels)
+
+    def read_pixels(self, bands: Sequence[int], pixels: np.ndarray) -> np.ndarray:
+        return self.cube.read_pixels([self.t0 + x for x in bands], pixels)
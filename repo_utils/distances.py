@@ -0,0 +1,229 @@
+"""
+distances: bulk great-circle distances between sites
+
+`20_MGDistance.Rmd` builds the full matrix of distances between mini-grids with
+`st_distance()`, and checking that control points sit far enough from treated
+sites has meant nested loops of geodesic distances. A `DistanceIndex` puts a
+set of sites in a haversine ball tree once. It then answers nearest-k,
+within-radius, "far enough" and DBSCAN-style clustering queries for whole
+arrays of points at a time. `pairwise_distances()` computes full matrices in
+blocks of rows, so their memory stays bounded, even for 100k points written to
+a memory-mapped array.
+
+Distances are great-circle distances on a sphere of the Earth's mean radius.
+They are within 0.6% of geodesic distances on the WGS84 ellipsoid.
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+import shapely
+from typing import Any, Iterator, Optional, Tuple
+
+try:
+    from sklearn.neighbors import BallTree
+    from sklearn.cluster import DBSCAN
+except ImportError:
+    warnings.warn(
+        "The package scikit-learn is not found. Not the end of the world, but you cannot use DistanceIndex in repo_utils.distances."
+    )
+
+# The Earth's mean radius, in metres
+EARTH_RADIUS = 6371008.8
+
+
+def _lonlat(points: Any) -> Tuple[np.ndarray, np.ndarray]:
+    """Longitudes and latitudes of points, as a GeoDataFrame, GeoSeries, array of points or (n, 2) array"""
+    if hasattr(points, "geometry"):
+        points = points.geometry
+    points = np.asarray(points)
+    if points.dtype == object:
+        return shapely.get_x(points), shapely.get_y(points)
+    return points[:, 0].astype(np.float64), points[:, 1].astype(np.float64)
+
+
+def haversine(lon1: Any, lat1: Any, lon2: Any, lat2: Any) -> np.ndarray:
+    """Great-circle distances in metres between lon/lat degrees, with NumPy broadcasting"""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def iter_distance_blocks(
+    points: Any, others: Optional[Any] = None, block_size: int = 256
+) -> Iterator[Tuple[int, int, np.ndarray]]:
+    """Yields the distance matrix between two point sets, a block of rows at a time
+
+    Args:
+        points (Any): The row points, as a GeoDataFrame, GeoSeries, array of
+        points or (n, 2) array of lon/lat
+        others (Optional[Any], optional): The column points. Defaults to None,
+        which uses `points`.
+        block_size (int, optional): Rows per block, so each block takes
+        block_size * len(others) * 8 bytes. Defaults to 256.
+
+    Yields:
+        Tuple[int, int, np.ndarray]: (start, stop, block), where block holds the
+        distances in metres from rows start:stop to every column point
+    """
+    lon, lat = (np.radians(x) for x in _lonlat(points))
+    other_lon, other_lat = (lon, lat) if others is None else (np.radians(x) for x in _lonlat(others))
+    # Computed once rather than for every pair
+    other_cos = np.cos(other_lat)[None, :]
+    for start in range(0, len(lon), block_size):
+        stop = min(start + block_size, len(lon))
+        a = (
+            np.sin((other_lat[None, :] - lat[start:stop, None]) / 2) ** 2
+            + np.cos(lat[start:stop, None]) * other_cos * np.sin((other_lon[None, :] - lon[start:stop, None]) / 2) ** 2
+        )
+        yield start, stop, 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def pairwise_distances(
+    points: Any,
+    others: Optional[Any] = None,
+    block_size: int = 256,
+    dtype: Any = np.float32,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """Computes the full distance matrix between two point sets, in blocks of rows
+
+    Args:
+        points (Any): The row points, see `iter_distance_blocks()`
+        others (Optional[Any], optional): The column points. Defaults to None,
+        which uses `points`, as `st_distance(mgs)` does.
+        block_size (int, optional): Rows per block. Defaults to 256.
+        dtype (Any, optional): The matrix's type. Defaults to np.float32, which is
+        accurate to about a metre at continental distances.
+        out (Optional[np.ndarray], optional): An array to fill, such as a
+        `np.memmap` for matrices too big for memory. Defaults to None, which
+        allocates one.
+
+    Returns:
+        np.ndarray: The (points, others) matrix of distances, in metres
+    """
+    n_rows = len(_lonlat(points)[0])
+    n_cols = n_rows if others is None else len(_lonlat(others)[0])
+    if out is None:
+        out = np.empty((n_rows, n_cols), dtype=dtype)
+    for start, stop, block in iter_distance_blocks(points, others, block_size):
+        out[start:stop] = block
+    return out
+
+
+class DistanceIndex:
+    """A haversine ball tree over a set of sites, for bulk distance queries
+
+    Args:
+        sites (Any): The sites, as a GeoDataFrame in EPSG:4326, a GeoSeries, an
+        array of points or an (n, 2) array of lon/lat
+        leaf_size (int, optional): The ball tree's leaf size. Defaults to 40.
+    """
+
+    def __init__(self, sites: Any, leaf_size: int = 40):
+        self.index = sites.index if hasattr(sites, "index") else pd.RangeIndex(len(_lonlat(sites)[0]))
+        self.lon, self.lat = _lonlat(sites)
+        # A ball tree needs at least one site; with none, every query finds nothing
+        self.tree = BallTree(self._radians(sites), leaf_size=leaf_size, metric="haversine") if len(self.lon) else None
+
+    def __len__(self) -> int:
+        return len(self.lon)
+
+    @staticmethod
+    def _radians(points: Any) -> np.ndarray:
+        lon, lat = _lonlat(points)
+        # The haversine ball tree takes (lat, lon) in radians
+        return np.radians(np.column_stack([lat, lon]))
+
+    def _is_empty(self, radians: np.ndarray) -> bool:
+        """Whether a query has nothing to search, or nothing to search for"""
+        return self.tree is None or len(radians) == 0
+
+    def nearest(self, points: Any, k: int = 1, exclude_self: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Finds the k nearest sites to each point
+
+        Args:
+            points (Any): The query points, in any form `DistanceIndex` accepts
+            k (int, optional): Sites per point. Defaults to 1.
+            exclude_self (bool, optional): Whether the points are the indexed sites
+            themselves, so each one's own site is skipped. Defaults to False.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (distances, positions), both (points, k),
+            with distances in metres and the positions of the sites in the index,
+            nearest first. Without any site, both are (points, 0).
+        """
+        radians = self._radians(points)
+        if self._is_empty(radians):
+            shape = (len(radians), k if self.tree is not None else 0)
+            return np.zeros(shape), np.zeros(shape, dtype=np.int64)
+        distances, positions = self.tree.query(radians, k=k + exclude_self)
+        if exclude_self:
+            own = np.arange(len(positions))[:, None]
+            # Keep the k nearest that are not the point itself, even among ties at distance 0
+            order = np.argsort(positions == own, axis=1, kind="stable")[:, :k]
+            distances = np.take_along_axis(distances, order, axis=1)
+            positions = np.take_along_axis(positions, order, axis=1)
+        return distances * EARTH_RADIUS, positions
+
+    def within(self, points: Any, radius: float) -> pd.DataFrame:
+        """Finds every site within a distance of each point
+
+        Args:
+            points (Any): The query points
+            radius (float): The distance, in metres
+
+        Returns:
+            pd.DataFrame: One row per (point, site) pair, with "point" (the point's
+            position), "site" (the site's index label) and "distance" in metres,
+            sorted by point and distance
+        """
+        radians = self._radians(points)
+        if self._is_empty(radians):
+            return pd.DataFrame({"point": np.zeros(0, dtype=np.int64), "site": self.index[:0], "distance": np.zeros(0)})
+        positions, distances = self.tree.query_radius(
+            radians, r=radius / EARTH_RADIUS, return_distance=True, sort_results=True
+        )
+        counts = np.fromiter((len(x) for x in positions), dtype=np.int64, count=len(positions))
+        positions = np.concatenate(positions) if len(positions) else np.zeros(0, dtype=np.int64)
+        distances = np.concatenate(distances) if len(distances) else np.zeros(0)
+        return pd.DataFrame(
+            {
+                "point": np.repeat(np.arange(len(counts)), counts),
+                "site": self.index[positions.astype(np.int64)],
+                "distance": distances * EARTH_RADIUS,
+            }
+        )
+
+    def count_within(self, points: Any, radius: float) -> np.ndarray:
+        """Counts the sites within a distance, in metres, of each point"""
+        radians = self._radians(points)
+        if self._is_empty(radians):
+            return np.zeros(len(radians), dtype=np.int64)
+        return self.tree.query_radius(radians, r=radius / EARTH_RADIUS, count_only=True)
+
+    def far_from(self, points: Any, distance: float) -> np.ndarray:
+        """Checks which points are more than a distance, in metres, from every site
+
+        For instance, whether control points sit far enough from the treated
+        mini-grids. Returns a boolean array, one value per point.
+        """
+        return self.count_within(points, distance) == 0
+
+    def clusters(self, eps: float, min_samples: int = 1) -> np.ndarray:
+        """Groups the sites with DBSCAN on great-circle distances
+
+        Args:
+            eps (float): The neighbourhood distance, in metres
+            min_samples (int, optional): Sites a core site needs within `eps`,
+            itself included. Defaults to 1, which links every chain of sites
+            closer than `eps` into one cluster.
+
+        Returns:
+            np.ndarray: The cluster label of each site, -1 for noise
+        """
+        if self.tree is None:
+            return np.zeros(0, dtype=np.int64)
+        radians = np.radians(np.column_stack([self.lat, self.lon]))
+        dbscan = DBSCAN(eps=eps / EARTH_RADIUS, min_samples=min_samples, metric="haversine", algorithm="ball_tree")
+        return dbscan.fit_predict(radians)
@@ -0,0 +1,240 @@
+"""
+extraction: batched, concurrent and resumable zonal extractions
+
+Large `reduceRegions` calls over thousands of sites time out, and pulling the
+result with `geemap.ee_to_geopandas` asks for everything in one request. Here
+the sites are split into batches that are reduced concurrently, each retried
+with exponential backoff, and each written to a checkpoint folder as soon as it
+finishes, so a crashed or interrupted run picks up where it stopped.
+
+The reduction itself is done by a pluggable backend: `EarthEngineBackend` for
+Earth Engine, or `LocalBackend`, which runs `repo_utils.zonal_stats()` on a
+local raster stack and needs no network at all.
+"""
+
+import warnings
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import time
+import numpy as np
+import pandas as pd
+import shapely
+from typing import Any, Callable, List, Optional
+
+try:
+    import ee
+except ImportError:
+    warnings.warn(
+        "The package earthengine-api is not found. Not the end of the world, but you cannot use EarthEngineBackend."
+    )
+
+# The column that carries each site's position through a backend
+_SITE = "_site"
+
+
+class EarthEngineBackend:
+    """Reduces an Earth Engine image over each batch of sites with `reduceRegions`
+
+    Only the sites' geometries and positions are sent; their other columns are
+    joined back locally.
+
+    Args:
+        image (Any): The `ee.Image` to reduce, e.g. a monthly collection's `toBands()`
+        reducer (str, optional): The `ee.Reducer` to use, e.g. "mean" or "sum".
+        Defaults to "mean".
+        scale (Optional[float], optional): The scale to reduce at, in metres.
+        Defaults to 50, as in the notebooks.
+        radius (Optional[float], optional): Buffer radius in metres around each
+        site. Defaults to 1000; None uses the geometries as they are.
+        strip (Optional[List[str]], optional): Substrings removed from the band
+        names, e.g. ["_avg_rad"] to get "YYYYMMDD" columns. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        image: Any,
+        reducer: str = "mean",
+        scale: Optional[float] = 50,
+        radius: Optional[float] = 1000,
+        strip: Optional[List[str]] = None,
+    ):
+        self.image = image
+        self.reducer = reducer
+        self.scale = scale
+        self.radius = radius
+        self.strip = strip or []
+
+    def describe(self) -> str:
+        """Identifies the reduction, so that checkpoints from another one are not reused"""
+        return json.dumps(
+            ["ee", self.image.serialize(), self.reducer, self.scale, self.radius, self.strip]
+        )
+
+    def reduce(self, sites: Any) -> pd.DataFrame:
+        features = [
+            ee.Feature(ee.Geometry(shapely.geometry.mapping(geom)), {_SITE: int(i)})
+            for i, geom in zip(sites.index, sites.geometry)
+        ]
+        collection = ee.FeatureCollection(features)
+        if self.radius is not None:
+            radius = self.radius
+            collection = collection.map(lambda f: f.buffer(radius))
+        reduced = self.image.reduceRegions(
+            collection=collection,
+            reducer=getattr(ee.Reducer, self.reducer)(),
+            scale=self.scale,
+        )
+        df = pd.DataFrame([f["properties"] for f in reduced.getInfo()["features"]])
+        for text in self.strip:
+            df.columns = df.columns.str.replace(text, "")
+        return df
+
+
+class LocalBackend:
+    """Reduces a local raster stack over each batch of sites with `zonal_stats()`
+
+    Args:
+        stack (Any): A `RasterStack` or `TimeCube`
+        stat (str, optional): "mean" or "sum". Defaults to "mean".
+        radius (Optional[float], optional): Buffer radius in metres. Defaults to 1000.
+    """
+
+    def __init__(self, stack: Any, stat: str = "mean", radius: Optional[float] = 1000):
+        self.stack = stack
+        self.stat = stat
+        self.radius = radius
+
+    def describe(self) -> str:
+        return json.dumps(
+            ["local", list(self.stack.transform), list(self.stack.labels), self.stat, self.radius]
+        )
+
+    def reduce(self, sites: Any) -> pd.DataFrame:
+        from .zonal import zonal_stats
+
+        df = zonal_stats(sites.geometry.values, self.stack, stat=self.stat, radius=self.radius)
+        df.insert(0, _SITE, sites.index.to_numpy())
+        return df
+
+
+def _with_retries(
+    function: Callable[[], Any], max_retries: int, backoff: float
+) -> Any:
+    """Calls a function, retrying failures after exponentially growing, jittered waits"""
+    for attempt in range(max_retries + 1):
+        try:
+            return function()
+        except Exception:
+            if attempt == max_retries:
+                raise
+            time.sleep(backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+
+def _fingerprint(sites: Any, backend: Any, batches: List[np.ndarray]) -> str:
+    """Hashes everything that decides the contents of each batch"""
+    digest = hashlib.sha256()
+    for wkb in shapely.to_wkb(np.asarray(sites.geometry)):
+        digest.update(wkb)
+    for batch in batches:
+        digest.update(np.asarray(batch, dtype=np.int64).tobytes() + b"|")
+    digest.update(backend.describe().encode())
+    return digest.hexdigest()
+
+
+def run_extraction(
+    sites: Any,
+    backend: Any,
+    checkpoint_dir: str,
+    batch_size: int = 500,
+    max_workers: int = 4,
+    max_retries: int = 5,
+    backoff: float = 2.0,
+    show_progress: bool = False,
+    index: Optional[Any] = None,
+) -> Any:
+    """Reduces a backend over every site, in concurrent and resumable batches
+
+    Args:
+        sites (Any): A GeoDataFrame of sites
+        backend (Any): An `EarthEngineBackend`, a `LocalBackend`, or any object with
+        `describe() -> str` and `reduce(batch) -> DataFrame` methods, where the frame
+        has a "_site" column holding the batch's index values
+        checkpoint_dir (str): The folder finished batches are saved in. Re-running
+        with the same folder, sites, batch size and backend skips them.
+        batch_size (int, optional): Sites per request. Defaults to 500.
+        max_workers (int, optional): The most batches in flight at once. Defaults to 4.
+        max_retries (int, optional): Retries of a failing batch. Defaults to 5.
+        backoff (float, optional): Seconds before the first retry, doubled after
+        each. Defaults to 2.0.
+        show_progress (bool, optional): Whether to print each finished batch.
+        Defaults to False.
+        index (Optional[Any], optional): A `repo_utils.SiteIndex` of the sites, to
+        batch them tile by tile along its curve instead of in file order.
+        Defaults to None.
+
+    Raises:
+        RuntimeError: If some batches still failed after all their retries. The
+        others are checkpointed, so running again only retries the failed ones.
+
+    Returns:
+        The sites, with their index reset, and the backend's columns. With no
+        sites there is nothing to reduce, and the (empty) sites come back with
+        their own columns only.
+    """
+    sites = sites.reset_index(drop=True)
+    if len(sites) == 0:
+        return sites.copy()
+    if index is None:
+        batches = [np.arange(i, min(i + batch_size, len(sites))) for i in range(0, len(sites), batch_size)]
+    else:
+        batches = list(index.iter_batches(batch_size))
+    fingerprint = _fingerprint(sites, backend, batches)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    run_file = os.path.join(checkpoint_dir, "run.json")
+    if os.path.exists(run_file):
+        with open(run_file) as file:
+            if json.load(file)["fingerprint"] != fingerprint:
+                raise ValueError(
+                    f"The checkpoints in {checkpoint_dir} are from a different extraction. Use another folder or empty this one."
+                )
+    else:
+        with open(run_file, "w") as file:
+            json.dump({"fingerprint": fingerprint, "n_sites": len(sites), "batch_size": batch_size}, file)
+
+    n_batches = len(batches)
+    paths = [os.path.join(checkpoint_dir, f"batch_{i:05d}.parquet") for i in range(n_batches)]
+    pending = [i for i in range(n_batches) if not os.path.exists(paths[i])]
+    if show_progress and len(pending) < n_batches:
+        print(f"Resuming: {n_batches - len(pending)} of {n_batches} batches already done")
+
+    def run(i):
+        batch = sites.iloc[batches[i]]
+        df = _with_retries(lambda: backend.reduce(batch), max_retries, backoff)
+        df.columns = df.columns.astype(str)
+        # Written under a temporary name first, so a crash never leaves half a batch
+        df.to_parquet(paths[i] + ".tmp", index=False)
+        os.replace(paths[i] + ".tmp", paths[i])
+
+    errors = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, i): i for i in pending}
+        for n, future in enumerate(concurrent.futures.as_completed(futures)):
+            i = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors[i] = e
+            if show_progress:
+                status = f"failed: {errors[i]}" if i in errors else "done"
+                print(f"Batch {i + 1} of {n_batches} {status} ({n + 1} of {len(pending)} this run)")
+    if errors:
+        raise RuntimeError(
+            f"{len(errors)} of {n_batches} batches failed (first: batch {min(errors)}: {errors[min(errors)]}). Run again to retry them."
+        )
+
+    results = pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+    results = results.set_index(_SITE).reindex(sites.index)
+    return pd.concat([sites, results.drop(columns=sites.columns, errors="ignore")], axis=1)
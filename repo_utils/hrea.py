@@ -0,0 +1,242 @@
+"""
+hrea: windowed, concurrent reads of HREA settlement rasters around sites
+
+`28_HREAValidation.Rmd` downloads one national HREA raster per country and
+loops over the countries, loading each whole raster to score the mini-grids
+inside it. An `HreaIndex` reads the STAC items in `data/hrea` instead. It maps
+each site to its country's asset by bounding box, then reads only the small
+window around each site's buffer, from the local GeoTIFF when it has been
+downloaded and otherwise straight from the cloud-optimized GeoTIFF on S3,
+through HTTP range requests. Countries are read concurrently.
+
+As `terra::extract()` does for polygons, a pixel counts towards a site when its
+centre is inside the site's buffer.
+"""
+
+import concurrent.futures
+import glob
+import json
+import os
+import re
+import warnings
+import numpy as np
+import pandas as pd
+import shapely
+from typing import Any, Dict, Optional, Sequence
+
+from .extraction import _with_retries
+from .zonal import _as_tuple, buffer_points
+
+try:
+    import rasterio
+    import rasterio.features
+    from rasterio.windows import Window
+except ImportError:
+    warnings.warn(
+        "The package rasterio is not found. Not the end of the world, but you cannot read HREA rasters in repo_utils.hrea."
+    )
+
+# STAC item ids look like SLE_set_lightscore_2020
+_ITEM_ID = re.compile(r"^(?P<iso3>[A-Z]{3})_(?P<layer>.+)_(?P<year>\d{4})$")
+
+# GDAL settings for reading cloud-optimized GeoTIFFs over HTTP without listing folders
+_COG_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "CPL_VSIL_CURL_ALLOWED_EXTENSIONS": ".tif",
+    "GDAL_HTTP_MULTIRANGE": "YES",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+}
+
+
+class HreaIndex:
+    """An index of the HREA STAC items for one layer and year
+
+    Args:
+        directory (str): The folder holding the STAC items, e.g. "data/hrea", and
+        possibly the GeoTIFFs they describe
+        layer (str, optional): The HREA layer. Defaults to "set_lightscore".
+        year (int, optional): The year. Defaults to 2020.
+        countries (Optional[Dict[str, str]], optional): The ISO3 code of each
+        country name used by the sites, to choose between overlapping bounding
+        boxes. Defaults to None, which reads `countries.csv` in `directory` if it
+        exists.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        layer: str = "set_lightscore",
+        year: int = 2020,
+        countries: Optional[Dict[str, str]] = None,
+    ):
+        self.directory = directory
+        self.layer = layer
+        self.year = year
+        rows = []
+        for path in sorted(glob.glob(os.path.join(directory, f"*_{layer}_{year}.json"))):
+            with open(path) as file:
+                item = json.load(file)
+            match = _ITEM_ID.match(item["id"])
+            if match is None or item.get("type") != "Feature":
+                continue
+            local = os.path.join(directory, f"{item['id']}.tif")
+            rows.append(
+                {
+                    "id": item["id"],
+                    "iso3": match["iso3"],
+                    "minx": item["bbox"][0],
+                    "miny": item["bbox"][1],
+                    "maxx": item["bbox"][2],
+                    "maxy": item["bbox"][3],
+                    "href": local if os.path.exists(local) else item["assets"][layer]["href"],
+                }
+            )
+        self.items = pd.DataFrame(rows, columns=["id", "iso3", "minx", "miny", "maxx", "maxy", "href"])
+        if countries is None:
+            countries_file = os.path.join(directory, "countries.csv")
+            if os.path.exists(countries_file):
+                codes = pd.read_csv(countries_file)
+                countries = dict(zip(codes.iloc[:, 0], codes.iloc[:, 1]))
+        self.countries = countries or {}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def assign(self, sites: Any, country_column: Optional[str] = "country") -> pd.Series:
+        """Finds the item covering each site
+
+        A site inside several items' bounding boxes, as happens near borders, goes
+        to the item of its own country when `country_column` names a known
+        country, and otherwise to the smallest bounding box.
+
+        Args:
+            sites (Any): A GeoDataFrame of point sites in EPSG:4326
+            country_column (Optional[str], optional): The column holding each
+            site's country name. Defaults to "country", as in `mgs.geojson`.
+
+        Returns:
+            pd.Series: The item id of each site, aligned with the sites, or None
+            for sites outside every item
+        """
+        points = np.asarray(sites.geometry)
+        lon, lat = shapely.get_x(points), shapely.get_y(points)
+        items = self.items
+        inside = (
+            (lon[:, None] >= items["minx"].to_numpy())
+            & (lon[:, None] <= items["maxx"].to_numpy())
+            & (lat[:, None] >= items["miny"].to_numpy())
+            & (lat[:, None] <= items["maxy"].to_numpy())
+        )
+        # Lower scores win: outside the box, then another country, then box area
+        area = ((items["maxx"] - items["minx"]) * (items["maxy"] - items["miny"])).to_numpy()
+        score = np.where(inside, area / (area.max(initial=0) + 1), np.inf)
+        if country_column is not None and country_column in sites.columns:
+            iso3 = sites[country_column].map(self.countries).to_numpy()
+            score = score + (iso3[:, None] != items["iso3"].to_numpy()[None, :])
+        if score.shape[1] == 0:
+            return pd.Series(None, index=sites.index, dtype=object)
+        best = np.argmin(score, axis=1)
+        ids = items["id"].to_numpy()[best].astype(object)
+        ids[~inside.any(axis=1)] = None
+        return pd.Series(ids, index=sites.index)
+
+    def _read_item(self, href: str, buffers: np.ndarray, stats: Sequence[str]) -> np.ndarray:
+        """Reduces one item's raster over each buffer, reading one window per buffer"""
+        from affine import Affine
+
+        out = np.full((len(buffers), len(stats)), np.nan)
+        options = _COG_OPTIONS if href.startswith("http") else {}
+        with rasterio.Env(**options), rasterio.open(href) as dataset:
+            a, _, c, _, e, f = _as_tuple(dataset.transform)
+            for i, buffer in enumerate(buffers):
+                minx, miny, maxx, maxy = buffer.bounds
+                c0, c1 = max(int(np.floor((minx - c) / a)), 0), min(int(np.ceil((maxx - c) / a)), dataset.width)
+                r0, r1 = max(int(np.floor((maxy - f) / e)), 0), min(int(np.ceil((miny - f) / e)), dataset.height)
+                if c1 <= c0 or r1 <= r0:
+                    continue
+                window = Window(c0, r0, c1 - c0, r1 - r0)
+                values = dataset.read(1, window=window, masked=True)
+                inside = rasterio.features.geometry_mask(
+                    [buffer],
+                    out_shape=values.shape,
+                    transform=Affine(a, 0, c + c0 * a, 0, e, f + r0 * e),
+                    invert=True,
+                )
+                values = values.astype(np.float64).filled(np.nan)[inside]
+                values = values[~np.isnan(values)]
+                if len(values) == 0:
+                    continue
+                for j, stat in enumerate(stats):
+                    out[i, j] = getattr(np, stat)(values)
+        return out
+
+    def extract(
+        self,
+        sites: Any,
+        radius: float = 1000,
+        stats: Sequence[str] = ("mean", "max"),
+        country_column: Optional[str] = "country",
+        max_workers: int = 8,
+        max_retries: int = 3,
+        backoff: float = 2.0,
+    ) -> Any:
+        """Reduces the layer over a buffer around every site, one country per worker
+
+        Args:
+            sites (Any): A GeoDataFrame of point sites in EPSG:4326, e.g.
+            `data/mgs/mgs_operational_pre_2020.geojson`
+            radius (float, optional): The buffer radius, in metres. Defaults to 1000.
+            stats (Sequence[str], optional): Statistics of the pixels in each buffer,
+            as names of NumPy reductions. Defaults to ("mean", "max").
+            country_column (Optional[str], optional): The sites' country column,
+            see `assign()`. Defaults to "country".
+            max_workers (int, optional): Countries read at once. Defaults to 8.
+            max_retries (int, optional): Retries of a country whose reads fail, e.g.
+            over a flaky connection. Defaults to 3.
+            backoff (float, optional): Seconds before the first retry, doubled after
+            each. Defaults to 2.0.
+
+        Returns:
+            The sites with one column per statistic, named like the notebook's
+            "lightscore_mean_1000", NaN for sites outside every item or without
+            valid pixels. Drop those and the geometry to get `mgs_results.csv`.
+
+        Raises:
+            RuntimeError: If some items could still not be read after all their
+            retries. Every other item is read first.
+        """
+        name = self.layer.removeprefix("set_")
+        columns = [f"{name}_{stat}_{radius:g}" for stat in stats]
+        ids = self.assign(sites, country_column)
+        buffers = buffer_points(sites.geometry, radius)
+        hrefs = dict(zip(self.items["id"], self.items["href"]))
+        groups = {item: np.flatnonzero((ids == item).to_numpy()) for item in ids.dropna().unique()}
+
+        values = np.full((len(sites), len(stats)), np.nan)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _with_retries,
+                    lambda href=hrefs[item], rows=rows: self._read_item(href, buffers[rows], list(stats)),
+                    max_retries,
+                    backoff,
+                ): item
+                for item, rows in groups.items()
+            }
+            errors = {}
+            for future in concurrent.futures.as_completed(futures):
+                item = futures[future]
+                try:
+                    values[groups[item]] = future.result()
+                except Exception as e:
+                    errors[item] = e
+        if errors:
+            first = min(errors)
+            raise RuntimeError(
+                f"Reading {len(errors)} of {len(groups)} items failed ({', '.join(sorted(errors))}; {first}: {errors[first]})."
+            )
+
+        sites = sites.copy()
+        for j, column in enumerate(columns):
+            sites[column] = values[:, j]
+        return sites
@@ -0,0 +1,255 @@
+"""
+integral: summed-area tables for fast buffer-radius sweeps, e.g. of population
+
+Notebooks 13 and 17 sum WorldPop over 1 km buffers with Earth Engine, so every
+robustness check at another radius is a full re-extraction. An `IntegralImage`
+builds a summed-area table (integral image) of each band once, tile by tile and
+only where there are sites. After that the sum over any rectangle is four
+lookups, however big the rectangle is.
+
+The table is read with bilinear interpolation, which gives the exact integral
+of the raster over rectangles with fractional pixel bounds. A disc is cut along
+pixel rows into one rectangle per row, with each rectangle's width set so that
+its area equals the disc's exact area in that row. The only approximation is
+therefore where the disc's curved edge crosses pixels of different values.
+"""
+
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Any, Optional, Sequence, Tuple
+
+from .zonal import _M_PER_DEG_LAT, _M_PER_DEG_LON
+
+
+def _segment_area(t: np.ndarray) -> np.ndarray:
+    """The area of the unit disc below height t (from -1 to t)"""
+    t = np.clip(t, -1, 1)
+    return t * np.sqrt(1 - t**2) + np.arcsin(t) + np.pi / 2
+
+
+class IntegralImage:
+    """Summed-area tables of a raster stack's bands, built per tile on demand
+
+    Tables are kept for reuse by later sweeps, and the least recently used ones
+    are dropped once they take more than `max_bytes`. Each table covers its tile
+    plus a margin for the largest radius asked for so far; a sweep with a larger
+    radius rebuilds it with a wider margin, while smaller radii reuse it as is.
+
+    Args:
+        stack (Any): A `RasterStack` or `TimeCube` on a lon/lat grid, e.g. one
+        WorldPop band per year
+        tile_size (int, optional): Tile height and width, in pixels. Defaults to
+        1024.
+        max_bytes (Optional[int], optional): Memory limit of the kept tables.
+        Defaults to 2 GB; None keeps every table.
+    """
+
+    def __init__(self, stack: Any, tile_size: int = 1024, max_bytes: Optional[int] = 2 * 1024**3):
+        self.stack = stack
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        # (band, tile row, tile col) -> (table, first row, first col, margin), oldest use first
+        self._tables: "OrderedDict[Tuple, Tuple[np.ndarray, int, int, int]]" = OrderedDict()
+        self._bytes = 0
+
+    def _margin(self, bands: Sequence[int], tile_row: int, tile_col: int, margin: int) -> int:
+        """The margin to use for a tile: the widest already built, if wide enough
+
+        The bands of a tile share one margin, so that they share their lookups.
+        """
+        built = [self._tables[key][3] for key in ((b, tile_row, tile_col) for b in bands) if key in self._tables]
+        return max([margin] + built)
+
+    def _table(self, band: int, tile_row: int, tile_col: int, margin: int) -> Tuple[np.ndarray, int, int]:
+        key = (band, tile_row, tile_col)
+        if key in self._tables and self._tables[key][3] == margin:
+            self._tables.move_to_end(key)
+            return self._tables[key][:3]
+        if key in self._tables:
+            self._bytes -= self._tables.pop(key)[0].nbytes
+
+        size, height, width = self.tile_size, self.stack.height, self.stack.width
+        r0, r1 = max(tile_row * size - margin, 0), min((tile_row + 1) * size + margin, height)
+        c0, c1 = max(tile_col * size - margin, 0), min((tile_col + 1) * size + margin, width)
+        rows, cols = np.mgrid[r0:r1, c0:c1]
+        values = self.stack.read_pixels([band], (rows * width + cols).ravel())[:, 0]
+        values = np.nan_to_num(values.reshape(r1 - r0, c1 - c0))
+        # table[i, j] is the sum of values[:i, :j]. It stays in float64: the
+        # running sums grow large, and float32 would lose the small differences
+        table = np.zeros((r1 - r0 + 1, c1 - c0 + 1))
+        table[1:, 1:] = values.cumsum(axis=0).cumsum(axis=1)
+
+        self._tables[key] = (table, r0, c0, margin)
+        self._bytes += table.nbytes
+        # Tables in use by the caller stay alive through its references
+        while self.max_bytes is not None and self._bytes > self.max_bytes and len(self._tables) > 1:
+            self._bytes -= self._tables.popitem(last=False)[1][0].nbytes
+        return table, r0, c0
+
+    def clear(self):
+        """Drops every table built so far"""
+        self._tables.clear()
+        self._bytes = 0
+
+    @staticmethod
+    def _box_lookups(shape: Tuple[int, int], x, y, x_radius, y_radius) -> Tuple[np.ndarray, np.ndarray]:
+        """Table positions and weights giving the sums over boxes around (x, y)
+
+        The integral from the table's origin to a fractional point is the bilinear
+        interpolation of the table's four surrounding entries, so a box with
+        fractional bounds takes 4 points of 4 entries each.
+        """
+        n_rows, n_cols = shape
+        index, weight = [], []
+        for dx, dy, sign in [(1, 1, 1), (-1, 1, -1), (1, -1, -1), (-1, -1, 1)]:
+            px = np.clip(x + dx * x_radius, 0, n_cols - 1)
+            py = np.clip(y + dy * y_radius, 0, n_rows - 1)
+            i = np.minimum(np.floor(py).astype(np.int64), n_rows - 2)
+            j = np.minimum(np.floor(px).astype(np.int64), n_cols - 2)
+            fy, fx = py - i, px - j
+            index += [i * n_cols + j, i * n_cols + j + 1, (i + 1) * n_cols + j, (i + 1) * n_cols + j + 1]
+            weight += [sign * (1 - fy) * (1 - fx), sign * (1 - fy) * fx, sign * fy * (1 - fx), sign * fy * fx]
+        return np.stack(index, axis=-1), np.stack(weight, axis=-1)
+
+    @staticmethod
+    def _disc_lookups(shape: Tuple[int, int], x, y, x_radius, y_radius) -> Tuple[np.ndarray, np.ndarray]:
+        """Table positions and weights giving the sums over discs around (x, y)
+
+        Each disc is cut into one strip per pixel row, as wide as gives the strip
+        the disc's exact area within that row. A strip lies within one row, so its
+        sum is its height times the difference of that row's running sum at its
+        two ends, i.e. 2 points of 4 table entries each.
+        """
+        n_rows, n_cols = shape
+        x, y = x[:, None], y[:, None]
+        x_radius, y_radius = x_radius[:, None], y_radius[:, None]
+        n_strips = 2 * int(np.ceil(y_radius.max(initial=0))) + 2
+        rows = np.floor(y - y_radius) + np.arange(n_strips)
+        y0 = np.maximum(rows, y - y_radius)
+        y1 = np.minimum(rows + 1, y + y_radius)
+        height = np.maximum(y1 - y0, 0)
+        area = x_radius * y_radius * (_segment_area((y1 - y) / y_radius) - _segment_area((y0 - y) / y_radius))
+        half_width = area / np.where(height > 0, height, 1) / 2
+        # Rows off the raster contribute nothing
+        height = np.where((rows >= 0) & (rows < n_rows - 1), height, 0)
+        i = np.clip(rows, 0, n_rows - 2).astype(np.int64)
+
+        index, weight = [], []
+        for sign in [1, -1]:
+            px = np.clip(x + sign * half_width, 0, n_cols - 1)
+            j = np.minimum(np.floor(px).astype(np.int64), n_cols - 2)
+            fx = sign * height * (px - j)
+            index += [(i + 1) * n_cols + j, i * n_cols + j, (i + 1) * n_cols + j + 1, i * n_cols + j + 1]
+            weight += [sign * height - fx, fx - sign * height, fx, -fx]
+        n_points = len(x)
+        return (
+            np.stack(index, axis=-1).reshape(n_points, -1),
+            np.stack(weight, axis=-1).reshape(n_points, -1),
+        )
+
+    def buffer_sums(
+        self,
+        lon: np.ndarray,
+        lat: np.ndarray,
+        radii: Sequence[float],
+        bands: Optional[Sequence[int]] = None,
+        shape: str = "disc",
+    ) -> np.ndarray:
+        """Sums each band over buffers around points
+
+        Args:
+            lon (np.ndarray): The points' longitudes
+            lat (np.ndarray): The points' latitudes
+            radii (Sequence[float]): The buffer radii, in metres
+            bands (Optional[Sequence[int]], optional): Zero-based band indices.
+            Defaults to None, which uses every band.
+            shape (str, optional): "disc" for round buffers, like `buffer_points()`,
+            or "box" for squares of side 2 * radius. Defaults to "disc".
+
+        Returns:
+            np.ndarray: A (points, radii, bands) array of sums, NaN for points
+            outside the raster
+        """
+        if shape not in ("disc", "box"):
+            raise ValueError(f"Unknown buffer shape {shape!r}, expected 'disc' or 'box'.")
+        lookups = self._disc_lookups if shape == "disc" else self._box_lookups
+        lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        radii = np.asarray(radii, dtype=np.float64)
+        bands = range(self.stack.count) if bands is None else list(bands)
+        a, _, c, _, e, f = self.stack.transform
+        # Point positions and buffer radii in (fractional) pixels
+        px, py = (lon - c) / a, (lat - f) / e
+        rx = radii[None, :] / (abs(a) * _M_PER_DEG_LON * np.cos(np.radians(lat)))[:, None]
+        ry = np.broadcast_to(radii[None, :] / (abs(e) * _M_PER_DEG_LAT), rx.shape)
+        margin = int(np.ceil(max(rx.max(initial=0), ry.max(initial=0)))) + 1
+
+        out = np.full((len(lon), len(radii), len(bands)), np.nan)
+        inside = np.flatnonzero((px >= 0) & (px < self.stack.width) & (py >= 0) & (py < self.stack.height))
+        size = self.tile_size
+        tiles = pd.DataFrame(
+            {
+                "row": np.floor(py[inside] / size).astype(np.int64),
+                "col": np.floor(px[inside] / size).astype(np.int64),
+            }
+        ).groupby(["row", "col"]).indices
+        for (tile_row, tile_col), points in tiles.items():
+            points = inside[points]
+            tile_row, tile_col = int(tile_row), int(tile_col)
+            tile_margin = self._margin(bands, tile_row, tile_col, margin)
+            tables = [self._table(band, tile_row, tile_col, tile_margin) for band in bands]
+            _, r0, c0 = tables[0]
+            x, y = px[points] - c0, py[points] - r0
+            for k in range(len(radii)):
+                # The lookups depend only on the geometry, so every band shares them
+                index, weight = lookups(tables[0][0].shape, x, y, rx[points, k], ry[points, k])
+                for b, (table, _, _) in enumerate(tables):
+                    out[points, k, b] = (table.ravel()[index] * weight).sum(axis=1)
+        return out
+
+
+def radius_sweep(
+    sites: Any,
+    stack: Any,
+    radii: Sequence[float] = (500, 1000, 2000, 5000),
+    shape: str = "disc",
+    integral: Optional[IntegralImage] = None,
+) -> pd.DataFrame:
+    """Sums every band of a stack over buffers of several radii around every site
+
+    Args:
+        sites (Any): A GeoDataFrame of point sites in EPSG:4326, or their geometries
+        stack (Any): A `RasterStack` or `TimeCube`, e.g. one WorldPop band per year
+        radii (Sequence[float], optional): Buffer radii in metres. Defaults to
+        (500, 1000, 2000, 5000).
+        shape (str, optional): "disc" or "box", see `IntegralImage.buffer_sums()`.
+        Defaults to "disc".
+        integral (Optional[IntegralImage], optional): An `IntegralImage` of the
+        same stack from an earlier sweep, to reuse its tables. Defaults to None.
+
+    Raises:
+        ValueError: If `integral` was built from another stack
+
+    Returns:
+        pd.DataFrame: One row per site, radius and band, with columns "site"
+        (the site's position), "radius", "band" (the band label) and "value"
+    """
+    import shapely
+
+    if integral is None:
+        integral = IntegralImage(stack)
+    elif integral.stack is not stack:
+        raise ValueError("The IntegralImage was built from another stack; its tables would give that stack's sums.")
+    geometries = np.asarray(sites.geometry if hasattr(sites, "geometry") else sites)
+    sums = integral.buffer_sums(shapely.get_x(geometries), shapely.get_y(geometries), radii, shape=shape)
+    n_sites, n_radii, n_bands = sums.shape
+    return pd.DataFrame(
+        {
+            "site": np.repeat(np.arange(n_sites), n_radii * n_bands),
+            "radius": np.tile(np.repeat(np.asarray(radii), n_bands), n_sites),
+            "band": pd.Categorical.from_codes(
+                np.tile(np.arange(n_bands), n_sites * n_radii), categories=list(stack.labels)
+            ),
+            "value": sums.ravel(),
+        }
+    )
@@ -0,0 +1,179 @@
+"""
+joins: bulk spatial joins of sites and buffers to grid cells
+
+`19_OEMapsValidation.Rmd` keeps precomputed products such as
+`mgs_iea_29_with_cell_id.geojson`, `grid_cells_mgs.geojson` and
+`mgs_29_buffer_1km.geojson`, because joining the sites to the grid cells is slow
+to redo. A `CellIndex` builds a packed STR tree over the cells once, and then
+joins thousands of points or buffers with a few vectorized bulk queries.
+`cell_index()` keeps the indexes it builds from files, so later calls on the
+same file, e.g. for another buffer size, reuse the tree.
+
+Area-weighted overlaps only intersect buffers that cross a cell boundary. A
+buffer inside one cell covers it with weight 1 without computing an
+intersection.
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import shapely
+from typing import Any, Optional, Tuple, Union
+
+from .zonal import buffer_points
+
+# Indexes built by cell_index(), by (path, id column) -> (mtime, index), least
+# recently used first
+_INDEXES: "OrderedDict[Tuple[str, str], Tuple[float, CellIndex]]" = OrderedDict()
+_MAX_INDEXES = 8
+
+
+class CellIndex:
+    """A packed STR tree over grid cells, for bulk joins
+
+    Args:
+        cells (Any): A GeoDataFrame of cell polygons, e.g. `data/oemap/grid_cells.geojson`
+        id_column (str, optional): The column identifying each cell. Defaults to
+        "grid_cell_id".
+    """
+
+    def __init__(self, cells: Any, id_column: str = "grid_cell_id"):
+        self.id_column = id_column
+        self.cells = cells.reset_index(drop=True)
+        geometries = np.asarray(self.cells.geometry)
+        # As st_make_valid() in the notebook, but only when something is invalid
+        if not shapely.is_valid(geometries).all():
+            geometries = shapely.make_valid(geometries)
+        self.geometries = geometries
+        self.ids = self.cells[id_column].to_numpy()
+        self.tree = shapely.STRtree(geometries)
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    def assign(self, sites: Any) -> pd.Series:
+        """Finds the cell each point is in
+
+        Args:
+            sites (Any): A GeoDataFrame, GeoSeries or array of points, in the cells' CRS
+
+        Returns:
+            pd.Series: The cell id of each site, aligned with the sites, or NaN for
+            sites outside every cell. A point on a shared edge goes to the
+            first cell in the cells' order.
+        """
+        geometries = np.asarray(sites.geometry if hasattr(sites, "geometry") else sites)
+        site, cell = self.tree.query(geometries, predicate="intersects")
+        # The first matching cell of each site
+        order = np.lexsort((cell, site))
+        site, cell = site[order], cell[order]
+        first = np.r_[True, site[1:] != site[:-1]] if len(site) else np.zeros(0, dtype=bool)
+        index = sites.index if hasattr(sites, "index") else pd.RangeIndex(len(geometries))
+        return pd.Series(self.ids[cell[first]], index=index[site[first]], name=self.id_column).reindex(index)
+
+    def overlaps(self, geometries: Any) -> pd.DataFrame:
+        """Area-weighted overlaps of polygons, such as site buffers, with the cells
+
+        Args:
+            geometries (Any): A GeoDataFrame, GeoSeries or array of polygons, in the
+            cells' CRS
+
+        Returns:
+            pd.DataFrame: One row per overlapping (site, cell) pair, with "site" (the
+            site's position), the cell id column, "area" (of the overlap, in the
+            CRS's units) and "weight" (the share of the site's area in that cell)
+        """
+        geometries = np.asarray(geometries.geometry if hasattr(geometries, "geometry") else geometries)
+        site, cell = self.tree.query(geometries, predicate="intersects")
+        site_area = shapely.area(geometries)
+        area = site_area[site].astype(np.float64)
+        # Only polygons crossing a cell boundary need an intersection
+        inside = shapely.within(geometries[site], self.geometries[cell])
+        crossing = np.flatnonzero(~inside)
+        area[crossing] = shapely.area(shapely.intersection(geometries[site[crossing]], self.geometries[cell[crossing]]))
+        keep = area > 0
+        site, cell, area = site[keep], cell[keep], area[keep]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = area / site_area[site]
+        return pd.DataFrame(
+            {"site": site, self.id_column: self.ids[cell], "area": area, "weight": weight}
+        ).sort_values(["site", self.id_column], ignore_index=True)
+
+    def with_cell_id(self, sites: Any, radius: Optional[float] = None) -> Any:
+        """Adds each site's cell id, like the `*_with_cell_id` products
+
+        Args:
+            sites (Any): A GeoDataFrame of point sites in EPSG:4326
+            radius (Optional[float], optional): A buffer radius in metres. When
+            given, the points are replaced by their buffers, like
+            `mgs_29_buffer_1km.geojson`. Defaults to None.
+
+        Returns:
+            The sites with the cell id column, keeping their points' cells when
+            buffered
+        """
+        sites = sites.copy()
+        sites[self.id_column] = self.assign(sites)
+        if radius is not None:
+            sites = sites.set_geometry(buffer_points(sites.geometry, radius), crs=sites.crs)
+        return sites
+
+    def cells_with_sites(self, sites: Any) -> Any:
+        """Joins the sites to the cells containing them, like `grid_cells_mgs.geojson`
+
+        Args:
+            sites (Any): A GeoDataFrame of point sites, in the cells' CRS
+
+        Returns:
+            A GeoDataFrame with one row per cell and site inside it, holding the
+            cell's id and geometry and the site's other columns
+        """
+        import geopandas as gpd
+
+        cell, site = self.tree.query(np.asarray(sites.geometry), predicate="intersects")[::-1]
+        order = np.lexsort((site, cell))
+        cell, site = cell[order], site[order]
+        attributes = sites.drop(columns=[sites.geometry.name]).iloc[site].reset_index(drop=True)
+        return gpd.GeoDataFrame(
+            attributes.assign(**{self.id_column: self.ids[cell]})[
+                [self.id_column] + list(attributes.columns.drop(self.id_column, errors="ignore"))
+            ],
+            geometry=self.geometries[cell],
+            crs=self.cells.crs,
+        )
+
+
+def cell_index(cells: Union[str, Any], id_column: str = "grid_cell_id") -> CellIndex:
+    """Returns a `CellIndex` of some cells, reusing the one built from the same file
+
+    Only indexes of files are kept, the last `_MAX_INDEXES` used, and a file's
+    index is built again once the file changes. A GeoDataFrame is indexed on
+    every call: keep the returned index to reuse it, as telling two frames apart
+    would cost about as much as building the tree.
+
+    Args:
+        cells (Union[str, Any]): A path to the cells, e.g.
+        "data/oemap/grid_cells.geojson", or a GeoDataFrame of them
+        id_column (str, optional): The column identifying each cell. Defaults to
+        "grid_cell_id".
+
+    Returns:
+        CellIndex: The index, shared with every other call on the same file
+    """
+    if not isinstance(cells, str):
+        return CellIndex(cells, id_column)
+    key = (os.path.abspath(cells), id_column)
+    mtime = os.path.getmtime(key[0])
+    if key in _INDEXES and _INDEXES[key][0] == mtime:
+        _INDEXES.move_to_end(key)
+        return _INDEXES[key][1]
+
+    import geopandas as gpd
+
+    # An index of an older version of the file is replaced, not kept alongside
+    _INDEXES.pop(key, None)
+    _INDEXES[key] = (mtime, CellIndex(gpd.read_file(cells), id_column))
+    while len(_INDEXES) > _MAX_INDEXES:
+        _INDEXES.popitem(last=False)
+    return _INDEXES[key][1]
@@ -0,0 +1,1220 @@
+"""
+lab: utilities for working with lab data
+
+The intention of this package is to encourage users to put all that they know
+about the Odyssey data sources into a single text file: the Odyssey data 
+dictionary. This will act as the "golden source of truth" on Odyssey's data. 
+The code in _this_ package is designed to parse the data dictionary and to 
+provide a higher-level syntax for getting to the useful data that we need.
+"""
+
+import yaml
+import warnings
+import concurrent.futures
+import hashlib
+import json
+import queue
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+from typing import Iterator, List, Optional, Any, Union
+import os
+
+# The YAML files and local caches live at the repository root, next to this package
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import pyodbc
+except ImportError:
+    warnings.warn(
+        "The package pyodbc is not found. Not the end of the world, but you cannot use ODBC connectivity."
+    )
+try:
+    import elasticsearch
+except ImportError:
+    warnings.warn(
+        "The package elasticsearch is not found. Not the end of the world, but you cannot use RESTful web API connectivity."
+    )
+
+
+# Parsed YAML files, keyed on their absolute path and stored with their mtime
+_yaml_cache = {}
+_yaml_cache_lock = threading.Lock()
+
+
+def _load_yaml(path: str) -> Any:
+    """Parses a YAML file, re-using the last parse while the file is unchanged"""
+    mtime = os.path.getmtime(path)
+    with _yaml_cache_lock:
+        cached = _yaml_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path) as file:
+        content = yaml.safe_load(file)
+    with _yaml_cache_lock:
+        _yaml_cache[path] = (mtime, content)
+    return content
+
+
+def load_metadata(
+    data_dict_file: str = "lab_data_dict.yml",
+    secrets_file: str = "odyssey_secrets.yml",
+) -> dict:
+    """Reads all metadata from key YAML files, to be reused throughout
+
+    The parsed files are memoized for the life of the process and are only read
+    again when their modification times change, so calling this in a loop is
+    cheap. The nested tables and columns are shared between callers: copy them
+    before editing.
+
+    Args:
+        data_dict_file (str, optional): The path to the main data dictionary,
+        containing everything but the secrets. Defaults to "odyssey_data_dict.
+        yml".
+        secrets_file (str, optional): The path to the connection secrets,
+        typically the username and password. Defaults to "odyssey_secrets.yml".
+
+    Returns:
+        dict: all of the metadata for the connection
+    """
+    if not os.path.isabs(secrets_file):
+        secrets_file = os.path.join(_REPO_ROOT, secrets_file)
+    secrets = _load_yaml(secrets_file)
+
+    if not os.path.isabs(data_dict_file):
+        data_dict_file = os.path.join(_REPO_ROOT, data_dict_file)
+    # Shallow copy, so that adding the secrets never touches the memoized parse
+    metadata = dict(_load_yaml(data_dict_file))
+
+    metadata["secrets"] = secrets
+
+    return metadata
+
+
+# The Elasticsearch cluster behind Odyssey's REST connection
+_REST_HOST = "https://f05fc8c52e6b4a99b838818f59bbda80.us-east-1.aws.found.io:9243"
+
+
+def create_connection(type: str = "rest", metadata: Optional[dict] = None) -> Any:
+    """Creates a connection to Odyssey of the selected type
+
+    This always builds a new connection. Most code should use `get_connection()`,
+    which re-uses one connection per type.
+
+    Args:
+        type (str, optional): The API to be used, currently only "rest" or "odbc_dsn".
+        Defaults to "rest".
+        metadata (Optional[dict], optional): The Odyssey metadata, typically
+        returned by `load_metadata()` and containing all of the credentials.
+        Defaults to None, which loads the metadata from the default locations.
+
+    Returns:
+        Any: A connection-type object, as appropriate for the connection type
+    """
+    if metadata is None:
+        metadata = load_metadata()
+
+    if type == "odbc_dsn":
+        connection_credentials = dict(
+            [x["kwargs"] for x in metadata["connections"] if x["type"] == "odbc_dsn"][0]
+        )
+        connection_credentials.update(metadata["secrets"])
+        return pyodbc.connect(**connection_credentials)
+    elif type == "rest":
+        secrets = metadata["secrets"]
+        id = secrets['api-id']
+        key = secrets['api-key']
+
+        return elasticsearch.Elasticsearch([_REST_HOST], api_key=(id,key),request_timeout=60, max_retries=2, retry_on_timeout=True)
+        # connection_credentials = [
+        #     x["kwargs"] for x in metadata["connections"] if x["type"] == "rest"
+        # ][0]
+        # # Slightly different secrets syntax compared to ODBC, but same underlying creds
+        # connection_credentials.update(
+        #     {"http_auth": (metadata["secrets"]["uid"], metadata["secrets"]["pwd"])}
+        # )
+        # return elasticsearch.Elasticsearch(**connection_credentials)
+    else:
+        raise ValueError(f"Connection type {type} not currently supported.")
+
+
+# Open connections, one per connection type, shared by everything in this module
+_connection_pool = {}
+_connection_pool_lock = threading.Lock()
+
+
+def get_connection(type: str = "rest") -> Any:
+    """Returns the shared connection of the selected type, creating it on first use
+
+    The Elasticsearch client keeps its own pool of HTTP connections and is safe
+    to share between threads, so re-using it avoids a new TLS handshake (and a new
+    secrets read) on every query.
+
+    Args:
+        type (str, optional): The API to be used, currently only "rest" or "odbc_dsn".
+        Defaults to "rest".
+
+    Returns:
+        Any: A connection-type object, as appropriate for the connection type
+    """
+    with _connection_pool_lock:
+        if type not in _connection_pool:
+            _connection_pool[type] = create_connection(type)
+        return _connection_pool[type]
+
+
+def close_connections():
+    """Closes and forgets every shared connection, e.g. after changing the secrets"""
+    with _connection_pool_lock:
+        for cnxn in _connection_pool.values():
+            try:
+                cnxn.close()
+            except Exception as e:
+                warnings.warn(f"Could not close connection {cnxn}: {e}")
+        _connection_pool.clear()
+
+
+def list_all_tables(cnxn: Optional[Any] = None) -> pd.DataFrame:
+    """Lists all table names for the current connection
+
+    Args:
+        cnxn (Optional[Any], optional): An Odyssey connection, as typically
+        returned by `create_connection()`. Defaults to None, which is the same
+        as using the shared default connection from `get_connection()`.
+
+    Returns:
+        pd.DataFrame: A list of all the tables that the connection recognizes.
+    """
+    if cnxn is None:
+        cnxn = get_connection()
+
+    # Because we don't REQUIRE PyODBC or Elasticsearch as modules, the connection
+    # checking is a bit awkward here:
+    cnxn_str = str(type(cnxn))
+    if _is_rest_connection(cnxn):
+        return sql_to_df("SHOW TABLES", cnxn)
+    elif cnxn_str == "<class 'pyodbc.Connection'>":
+        cursor = cnxn.cursor()
+        return pd.DataFrame(
+            columns=["name", "type"],
+            data=[[x[2], x[3]] for x in cursor.tables()],
+        )
+    else:
+        raise ValueError(f"Connection type {cnxn_str} not currently supported.")
+
+
+def list_all_columns(table_name: str, cnxn: Optional[Any] = None) -> pd.DataFrame:
+    """Lists all columns in the requested table. Due to oddities in the Elasticsearch
+    API, some of these columns may not be SELECTable (bad column names seem to be the
+    cause), and due to Odyssey conventions, MANY columns may not contain data or be at
+    all useful.
+
+    Args:
+        table_name (str): The table's name
+        cnxn (Optional[Any], optional): An Odyssey connection, as typically
+        returned by `create_connection()`. Defaults to None, which is the same
+        as using the shared default connection from `get_connection()`. Only the rest
+        connection is currently supported for this function.
+
+    Returns:
+        pd.DataFrame: A table listing all of the column names ("column"), their SQL
+        type ("type"), and a mapping to something Python-ish ("mapping")
+    """
+    if cnxn is None:
+        cnxn = get_connection()
+
+    # Because we don't REQUIRE PyODBC or Elasticsearch as modules, the connection
+    # checking is a bit awkward here:
+    cnxn_str = str(type(cnxn))
+    if _is_rest_connection(cnxn):
+        df = sql_to_df(f"SHOW COLUMNS IN {table_name}", cnxn)
+        # STRUCT columns show in this query, but they cannot be asked to return data.
+        # Filter them out: their subfields are also listed and CAN be queried
+        return df[df["type"] != "STRUCT"].reset_index(drop=True)
+    else:
+        raise ValueError(f"Connection type {cnxn_str} not currently supported.")
+
+
+# How `query()` treats each column type of the data dictionary
+_COLUMN_CATEGORIES = {
+    "int": "sum",
+    "float": "sum",
+    "count": "count",
+    "calculated_field": "calculated",
+    "int_date": "group_by",
+    "str": "group_by",
+    "datetime": "group_by",
+    "hour_int": "group_by",
+}
+
+
+class TableDictionary:
+    """The compiled data dictionary entry of a single Odyssey table
+
+    Args:
+        table (dict): One entry of `metadata["tables"]`
+    """
+
+    def __init__(self, table: dict):
+        self.name = table["name"]
+        self.lab_name = table.get("lab_name")
+        self.useful_columns = table["useful_columns"]
+        lab_names = [x.get("lab_name", x["name"]) for x in self.useful_columns]
+        # Name translations in both directions, and the type of every lab column
+        self.to_odyssey = {lab: x["name"] for lab, x in zip(lab_names, self.useful_columns)}
+        self.to_lab = {x["name"]: lab for lab, x in zip(lab_names, self.useful_columns)}
+        self.types = {lab: x["type"] for lab, x in zip(lab_names, self.useful_columns)}
+        # Lab columns per query category, in data dictionary order
+        self.categories = {x: [] for x in ["sum", "count", "calculated", "group_by"]}
+        for lab, col_type in self.types.items():
+            if col_type in _COLUMN_CATEGORIES:
+                self.categories[_COLUMN_CATEGORIES[col_type]].append(lab)
+
+    def select(self, columns: list) -> dict:
+        """Splits requested lab columns into the query categories
+
+        Args:
+            columns (list): Lab names of the requested columns
+
+        Returns:
+            dict: The requested columns under "sum", "count", "calculated" and
+            "group_by", each in data dictionary order
+        """
+        requested = set(columns)
+        return {
+            category: [x for x in cols if x in requested]
+            for category, cols in self.categories.items()
+        }
+
+
+class DataDictionary:
+    """The Odyssey data dictionary, compiled for constant-time lookups
+
+    Tables can be looked up by either their Odyssey name or their lab name. Build
+    one with `get_data_dictionary()`, which re-uses the compiled dictionary for as
+    long as the YAML file is unchanged.
+
+    Args:
+        metadata (dict): The Odyssey metadata, as returned by `load_metadata()`
+    """
+
+    def __init__(self, metadata: dict):
+        self.tables = [TableDictionary(x) for x in metadata["tables"]]
+        self._by_name = {x.name: x for x in self.tables}
+        self._by_lab_name = {x.lab_name: x for x in self.tables if x.lab_name is not None}
+
+    def __contains__(self, table_name: str) -> bool:
+        return table_name in self._by_name or table_name in self._by_lab_name
+
+    def table(self, table_name: str) -> TableDictionary:
+        """Finds a table by its Odyssey name or, failing that, its lab name"""
+        table = self._by_name.get(table_name) or self._by_lab_name.get(table_name)
+        if table is None:
+            raise ValueError(
+                f"Table {table_name} not found in metadata. Check your spelling?"
+            )
+        return table
+
+    def find_table_in_sql(self, sql_query: str) -> Optional[TableDictionary]:
+        """Returns the first known Odyssey table named in a SQL query, if any"""
+        for word in sql_query.split():
+            if word.strip(",;()") in self._by_name:
+                return self._by_name[word.strip(",;()")]
+        return None
+
+
+# Compiled dictionaries, keyed on the identity of the memoized "tables" list,
+# which only changes when the data dictionary file is parsed again
+_data_dictionaries = {}
+
+
+def get_data_dictionary(metadata: Optional[dict] = None) -> DataDictionary:
+    """Returns the compiled data dictionary, compiling it only when it has changed
+
+    Args:
+        metadata (Optional[dict], optional): The Odyssey metadata, typically
+        returned by `load_metadata()`. Defaults to None, which loads the metadata
+        from the default locations.
+
+    Returns:
+        DataDictionary: The compiled data dictionary
+    """
+    if metadata is None:
+        metadata = load_metadata()
+    key = id(metadata["tables"])
+    cached = _data_dictionaries.get(key)
+    # Keep a reference to the list itself, so that its id cannot be recycled
+    if cached is None or cached[0] is not metadata["tables"]:
+        cached = (metadata["tables"], DataDictionary(metadata))
+        _data_dictionaries.clear()
+        _data_dictionaries[key] = cached
+    return cached[1]
+
+
+def get_useful_columns(
+    table_name: str, format: Optional[str] = "str", metadata: Optional[dict] = None
+) -> Any:
+    """Provides the names of the useful columns for a particular table
+
+    Args:
+        table_name (str): The table's name
+        format (Optional[str], optional): Either "str", "dataframe", or "list", makes
+        the function return either a single, comma-separated string (useful for SQL
+        queries) or a DataFrame (complete with descriptions of each column) or
+        list of strings (useful for pandas slicing). Defaults to "str".
+        metadata (Optional[dict], optional): The Odyssey metadata, typically
+        returned by `load_metadata()` and containing all of the raw table metadata.
+        Defaults to None, which loads the metadata from the default locations.
+
+    Returns:
+        Either a comma-separated string or a dataframe or a list of strings of column names that are worth loading and using.
+    """
+    cols = get_data_dictionary(metadata).table(table_name).useful_columns
+
+    if format == "dataframe":
+        return pd.DataFrame(data=cols)
+    elif format == "list":
+        return [x["name"] for x in cols]
+    elif format == "str":
+        return ", ".join([x["name"] for x in cols])
+    else:
+        raise ValueError(f"Format type {format} not currently supported.")
+
+
+_INT32 = np.iinfo(np.int32)
+
+
+def _to_int32(values: tuple) -> Any:
+    """Builds a nullable integer column, Int32 where the values fit
+
+    Values beyond the int32 range give Int64, and non-integral values are kept
+    as floats, rather than being wrapped or truncated.
+    """
+    data = np.array(values)
+    if data.dtype.kind in "iu":
+        # Fast path straight into an integer buffer, when there are no nulls
+        fits = len(data) == 0 or (data.min() >= _INT32.min and data.max() <= _INT32.max)
+        data = data.astype(np.int32 if fits else np.int64)
+        return pd.arrays.IntegerArray(data, np.zeros(len(data), dtype=bool))
+    if len(data) == 0:
+        return pd.array([], dtype="Int32")
+    if data.dtype.kind == "f":
+        return data.astype(np.float64)
+    # Nulls, or mixed values, need the slower masked build
+    try:
+        array = pd.array(values, dtype="Int64")
+    except (TypeError, ValueError):
+        return _infer(values)
+    fits = array.isna().all() or (array.min() >= _INT32.min and array.max() <= _INT32.max)
+    return array.astype("Int32") if fits else array
+
+
+def _to_float64(values: tuple) -> np.ndarray:
+    # None becomes NaN, which is what the DataFrame constructor would give
+    return np.array(values, dtype=np.float64)
+
+
+def _to_datetime(values: tuple) -> pd.DatetimeIndex:
+    # Elasticsearch always returns ISO 8601 strings, so skip format inference
+    return pd.to_datetime(list(values), format="ISO8601")
+
+
+def _infer(values: tuple) -> pd.Series:
+    return pd.Series(values, dtype=None if len(values) else object)
+
+
+_DECODERS = {
+    "datetime": _to_datetime,
+    "integer": _to_int32,
+    "double": _to_float64,
+    "float": _to_float64,
+    "half_float": _to_float64,
+    "scaled_float": _to_float64,
+}
+
+
+def _build_decode_plan(columns_meta: List[dict]) -> List[tuple]:
+    """Works out, once per query, how each column of a page is to be decoded
+
+    Args:
+        columns_meta (List[dict]): The "columns" entry of the first Elasticsearch
+        SQL response, holding the name and SQL type of every column
+
+    Returns:
+        List[tuple]: One (name, converter) pair per column, in response order
+    """
+    return [(col["name"], _DECODERS.get(col["type"], _infer)) for col in columns_meta]
+
+
+def _decode_page(rows: list, plan: List[tuple]) -> pd.DataFrame:
+    """Builds a typed DataFrame from a single page of Elasticsearch SQL rows
+
+    The rows are transposed once and every column is converted straight to its
+    final dtype, rather than building an object frame and casting it column by
+    column afterwards.
+
+    Args:
+        rows (list): The "rows" entry of an Elasticsearch SQL response
+        plan (List[tuple]): The conversion plan from `_build_decode_plan()`
+
+    Returns:
+        pd.DataFrame: The page, with datetime, integer and float columns typecast
+    """
+    columns = list(zip(*rows)) if rows else [()] * len(plan)
+    # Keyed by position, so that columns sharing a name are all kept
+    data = {}
+    for i, ((_, convert), values) in enumerate(zip(plan, columns)):
+        data[i] = convert(values)
+    df = pd.DataFrame(data, index=pd.RangeIndex(len(rows)), copy=False)
+    df.columns = [name for name, _ in plan]
+    return df
+
+
+def _is_rest_connection(cnxn: Any) -> bool:
+    """Checks whether a connection speaks the Elasticsearch SQL API
+
+    Anything exposing `sql.query(body=...)` is accepted as well, so that a local
+    fake client can stand in for Odyssey when testing or benchmarking.
+    """
+    cnxn_str = str(type(cnxn))
+    if cnxn_str in [
+        "<class 'elasticsearch.Elasticsearch'>",
+        "<class 'elasticsearch.client.Elasticsearch'>",
+    ]:
+        return True
+    return callable(getattr(getattr(cnxn, "sql", None), "query", None))
+
+
+def _query_page(cnxn: Any, body: dict) -> dict:
+    """Requests a single page from the Elasticsearch SQL API"""
+    if str(type(cnxn)).startswith("<class 'elasticsearch."):
+        return elasticsearch.client.SqlClient.query(self=cnxn, body=body)
+    return cnxn.sql.query(body=body)
+
+
+def _iter_es_responses(sql_query: str, cnxn: Any) -> Iterator[dict]:
+    """Walks the Elasticsearch SQL cursor, yielding each raw response in turn"""
+    response = _query_page(
+        cnxn, {"query": sql_query, "field_multi_value_leniency": "true"}
+    )
+    while True:
+        # Check for a cursor in the response, indicating that more rows are to come.
+        cursor = response.get("cursor")
+        yield response
+        if cursor is None:
+            return
+        response = _query_page(cnxn, {"cursor": cursor})
+
+
+def _prefetch(iterator: Iterator[Any], depth: int) -> Iterator[Any]:
+    """Runs an iterator on a background thread, keeping up to `depth` items ready
+
+    The consumer receives items in the original order. Errors raised by the
+    iterator are re-raised in the consumer, and closing the returned generator
+    early stops the worker.
+
+    Args:
+        iterator (Iterator[Any]): The iterator to run ahead of the consumer
+        depth (int): The size of the bounded queue between the worker and the consumer
+
+    Yields:
+        Any: The items of `iterator`
+    """
+    done = object()
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # Poll so that the worker notices when the consumer has gone away
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def work():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    worker = threading.Thread(target=work, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+            del item
+    finally:
+        stop.set()
+
+
+def iter_sql_to_df(
+    sql_query: str,
+    cnxn: Optional[Any] = None,
+    show_progress: Optional[bool] = False,
+    chunksize: Optional[int] = 10000,
+    prefetch: Optional[int] = 0,
+) -> Iterator[pd.DataFrame]:
+    """Queries the Odyssey Database and yields the data one chunk at a time
+
+    Each chunk is handed back as soon as it has been decoded and is not kept
+    around afterwards, so memory use stays flat however many pages the query
+    returns. Use this instead of `sql_to_df()` when the result is to be
+    aggregated or written to disk incrementally.
+
+    Args:
+        sql_query (str): A valid SQL query. Multiline strings via triple quotes seem to be fine.
+        cnxn (Optional[Any], optional): An Odyssey connection, as typically
+        returned by `create_connection()`. Defaults to None, which is the same
+        as using the shared default connection from `get_connection()`.
+        show_progress (Optional[bool], optional): Prints progress on large queries, once every 10 pages. Defaults to False.
+        chunksize (Optional[int], optional): Number of rows per chunk for ODBC
+        connections. Elasticsearch chunks are always one cursor page. Defaults to 10000.
+        prefetch (Optional[int], optional): Number of Elasticsearch pages to request
+        ahead on a background thread while the current page is being decoded. Memory
+        use grows with this number. Defaults to 0, which fetches strictly in turn.
+
+    Yields:
+        pd.DataFrame: Consecutive chunks of the Odyssey data requested by the SQL string
+    """
+    if cnxn is None:
+        cnxn = get_connection()
+
+    cnxn_str = str(type(cnxn))
+    if _is_rest_connection(cnxn):
+        responses = _iter_es_responses(sql_query, cnxn)
+        if prefetch > 0:
+            responses = _prefetch(responses, prefetch)
+
+        iter_num = 1
+        plan = None
+
+        for response in responses:
+            if iter_num == 1:
+                plan = _build_decode_plan(response["columns"])
+
+            more_to_come = "cursor" in response
+            rows = response["rows"]
+            # Drop the raw response before decoding so that only one copy is alive
+            del response
+            df = _decode_page(rows, plan)
+            del rows
+            yield df
+            del df
+
+            if more_to_come:
+                if show_progress and (iter_num % 10 == 0):
+                    print(f"Up to {iter_num}k rows read")
+                iter_num += 1
+            elif show_progress:
+                print("All rows read")
+    elif cnxn_str == "<class 'pyodbc.Connection'>":
+        if show_progress:
+            print("Showing progress is not currently supported for ODBC connections")
+        yield from pd.read_sql(sql_query, cnxn, chunksize=chunksize)
+    else:
+        raise ValueError(f"Connection type {cnxn_str} not currently supported.")
+
+
+def sql_to_df(
+    sql_query: str,
+    cnxn: Optional[Any] = None,
+    show_progress: Optional[bool] = False,
+    prefetch: Optional[int] = 0,
+) -> pd.DataFrame:
+    """Queries the Odyssey Database and returns the data to a Pandas DataFrame
+
+    Args:
+        sql_query (str): A valid SQL query. Multiline strings via triple quotes seem to be fine.
+        cnxn (Optional[Any], optional): An Odyssey connection, as typically
+        returned by `create_connection()`. Defaults to None, which is the same
+        as using the shared default connection from `get_connection()`.
+        show_progress (Optional[bool], optional): Prints progress on large queries, once every 10k rows. Defaults to False.
+        prefetch (Optional[int], optional): Number of Elasticsearch pages to request
+        ahead while the current page is decoded. See `iter_sql_to_df()`. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: The Odyssey data requested by the SQL string
+    """
+    if cnxn is None:
+        cnxn = get_connection()
+
+    cnxn_str = str(type(cnxn))
+    if cnxn_str == "<class 'pyodbc.Connection'>":
+        if show_progress:
+            print("Showing progress is not currently supported for ODBC connections")
+        return pd.read_sql(sql_query, cnxn)
+    return pd.concat(
+        iter_sql_to_df(sql_query, cnxn, show_progress=show_progress, prefetch=prefetch),
+        ignore_index=True,
+    )
+
+
+def parse_to_sql(list_to_parse, how: str = "str", function: str = ""):
+    """Function to parse list to elastic search format
+    Args:
+        list_to_parse (list): List parsing to perform query
+        how (str): list or string. List will give a list of strings
+        that can be used to loop while str will put all values in 
+        a single str
+        function (str): type of summarizing function to be added to each variable in the list
+        it can be any of SQL SUM, COUNT, DISTINCT
+    Returns:
+        str: string of parsed
+    """
+    if how == "list":
+        parsed_list = "('" + "', '".join(list_to_parse) + "')"
+    elif function == "":
+        parsed_list = "', '".join(list_to_parse)
+    elif function != "DISTINCT":
+        parsed_list = " ".join([f"{function}({x})" for x in list_to_parse])
+    else:
+        parsed_list = " ".join([f"COUNT( DISTINCT {x})" for x in list_to_parse])
+    return parsed_list
+
+
+# Quoted strings, kept as they are, or runs of whitespace, collapsed to one space
+_SQL_WHITESPACE = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|\s+""")
+
+
+class QueryCache:
+    """A content-addressed, on-disk cache of raw query results
+
+    Results are stored as Parquet, so dtypes survive the round trip, under a key
+    derived from the normalized SQL and the data source it is run against.
+    Entries older than `ttl` seconds are treated as missing, and the least
+    recently used entries are evicted whenever the cache grows beyond `max_bytes`.
+
+    Args:
+        cache_dir (str, optional): Where to keep the cache. Relative paths are taken
+        from the repository root. Defaults to ".query_cache".
+        ttl (Optional[float], optional): Maximum age of a usable entry, in seconds.
+        Defaults to None, which never expires entries.
+        max_bytes (Optional[int], optional): Size limit of the whole cache. Defaults
+        to 5 GB; None disables eviction.
+        source (str, optional): The data source the queries run against, part of
+        every key so that results from different clusters never mix. Defaults to
+        the host of the REST connection `query()` uses.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".query_cache",
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = 5 * 1024**3,
+        source: str = _REST_HOST,
+    ):
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(_REPO_ROOT, cache_dir)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.source = source
+
+    @staticmethod
+    def normalize(sql_query: str) -> str:
+        """Collapses whitespace outside quotes and trailing semicolons, which don't change a query"""
+        collapsed = _SQL_WHITESPACE.sub(lambda m: m.group(1) if m.group(1) is not None else " ", sql_query)
+        return collapsed.strip().rstrip(";").strip()
+
+    def key(self, sql_query: str) -> str:
+        text = self.source + "\n" + self.normalize(sql_query)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _paths(self, sql_query: str) -> tuple:
+        base = os.path.join(self.cache_dir, self.key(sql_query))
+        return base + ".parquet", base + ".json"
+
+    def get(self, sql_query: str) -> Optional[pd.DataFrame]:
+        """Returns the cached result for a query, or None if missing or expired"""
+        data_path, info_path = self._paths(sql_query)
+        if not (os.path.exists(data_path) and os.path.exists(info_path)):
+            return None
+        with open(info_path) as file:
+            info = json.load(file)
+        if self.ttl is not None and time.time() - info["created"] > self.ttl:
+            return None
+        df = pd.read_parquet(data_path)
+        # The data file's mtime doubles as the last-used time for LRU eviction
+        os.utime(data_path)
+        return df
+
+    def put(self, sql_query: str, df: pd.DataFrame):
+        """Stores the result of a query, then evicts old entries if needed"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data_path, info_path = self._paths(sql_query)
+        # Write to a temporary name first so a crash never leaves a half-written entry
+        df.to_parquet(data_path + ".tmp", index=False)
+        os.replace(data_path + ".tmp", data_path)
+        with open(info_path, "w") as file:
+            json.dump(
+                {"source": self.source, "sql": self.normalize(sql_query), "created": time.time(), "rows": len(df)},
+                file,
+            )
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in `max_bytes`"""
+        if self.max_bytes is None or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".parquet"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name[: -len(".parquet")]))
+        total = sum(x[1] for x in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for ext in [".parquet", ".json"]:
+                path = os.path.join(self.cache_dir, key + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Removes every entry in the cache"""
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith((".parquet", ".json")):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+# The cache used by `query()`. Adjust its settings in a notebook with, e.g.,
+# `repo_utils.QUERY_CACHE.ttl = 7 * 24 * 3600`
+QUERY_CACHE = QueryCache()
+
+
+def query(
+    sql_query: Optional[str] = "",
+    table_name: Optional[str] = "",
+    columns: Optional[list] = "",
+    filters: Optional[str] = "",
+    run_queries: Optional[bool] = True,
+    show_progress: Optional[bool] = False,
+    stream: Optional[bool] = False,
+    prefetch: Optional[int] = 0,
+    cache: Optional[str] = "off",
+    partitions: Optional[List[str]] = None,
+    max_workers: Optional[int] = 4,
+    time_granularity: Optional[str] = None,
+    ) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """Function to run a simplified version of Odyssey queries. It can also run regular SQL queries, perform some pre-formatting for dates
+    and calculate other columns.
+    Args:
+        sql_query (str, optional): regular elasticsearch SQL query using fields available in Odyssey.
+        table_name (str, optional): name of table including raw (hourly), daily, and monthly.
+        columns (list, optional): list of columns using the Lab convention. Go to lab_data_dict.yml for details.
+        filters (str, optional): a single string containing filters for the query. It's the "WHERE" part of an SQL query. You can use either Oydssey or Lab names.
+        run_queries: (bool, optional): whether to run this query, or not. Preferrably link this to a variable in the beginning of your notebook that will
+        deactivate all the queries at once. This way we can stop commenting out queries throughout a notebook to avoid running them. When False, the
+        result of the last run of the same query is returned from the local cache, if it was stored there with cache="write" or "read", or None
+        if there is none. Defaults to True.
+        show_progress (bool, optional) : whether you want to see progress of query. Defaults to False.
+        stream (bool, optional): whether to return an iterator of processed DataFrame chunks, one per
+        cursor page, instead of a single DataFrame. Useful for aggregating or writing to disk incrementally. Defaults to False.
+        prefetch (int, optional): number of cursor pages to fetch ahead while the current one is decoded. Defaults to 0.
+        cache (str, optional): how to use the on-disk result cache in `QUERY_CACHE`, keyed on the normalized SQL. One of "off" (never touch it),
+        "write" (always query, then store the result), "read" (return a fresh cached result if there is one, else query and store) or
+        "only" (never query; same as run_queries=False). Streamed results are not written to the cache. Defaults to "off", so nothing is
+        written to disk unless asked for.
+        partitions (list, optional): disjoint filters, e.g. from `make_partitions()`, that split a lab-name query into smaller queries run
+        concurrently. Summed columns are re-aggregated and ACPU/ARPU recomputed after merging. Distinct counts (e.g. meter_count) cannot be
+        added up across partitions, so a ValueError is raised if any group of a query with a count column spans two partitions: split such
+        queries along a group-by column instead (e.g. by site, or by month when grouping by month).
+        Cannot be combined with `sql_query` or `stream`. Defaults to None, which runs a single query.
+        max_workers (int, optional): maximum number of partitions queried at once. Defaults to 4.
+        time_granularity (str, optional): one of "hour", "day", "month" or "year". Truncates the datetime columns of a lab-name query to that
+        bucket inside Odyssey, so only one row per bucket is downloaded (e.g. one row per site-month instead of ~720 hourly rows). The
+        summed columns become bucket totals and ACPU/ARPU are derived from those totals. Defaults to None, which groups by the raw timestamp.
+    """
+    if cache not in ["off", "write", "read", "only"]:
+        raise ValueError(f"Cache mode {cache} not currently supported.")
+    if partitions and (sql_query != "" or stream):
+        raise ValueError("Partitions are only supported for non-streamed lab-name queries.")
+    if time_granularity is not None and time_granularity not in _TIME_GRANULARITIES:
+        raise ValueError(f"Time granularity {time_granularity} not currently supported.")
+
+    metadata = load_metadata()
+
+    if run_queries == False:
+        print("CAUTION: You are about to run the rest of the analysis using data previously downloaded. You are not runing a new query.")
+        cache = "only"
+
+    data_dictionary = get_data_dictionary(metadata)
+
+    if sql_query != "":
+        table = data_dictionary.find_table_in_sql(sql_query)
+        to_lab = table.to_lab if table is not None else {}
+
+        def process(df):
+            df.columns = [to_lab.get(x, x) for x in df.columns]
+            return df
+
+        query = sql_query
+    else:    
+        #Checking that the values needed for the query are included
+        if "ACPU" in columns and "consump_kwh" not in columns:
+            columns.insert(len(columns), "consump_kwh")
+        
+        if "ACPU" or "ARPU" in columns and "meter_count" not in columns:
+            columns.insert(len(columns), "meter_count")
+
+        if "ARPU" in columns and "revenue_lc" not in columns:
+            columns.insert(len(columns), "revenue_lc")
+
+        if "year_month" in columns and "timestamp" not in columns:
+            columns.insert(len(columns), "timestamp")
+
+        table = data_dictionary.table(table_name)
+        to_odyssey = table.to_odyssey
+
+        # Assign input fields into categories based on required pre-processing/calculation
+        selected = table.select(columns)
+        sum_columns_pre_query, count_columns_pre_query, group_by_cols = [
+            selected[x] for x in ["sum", "count", "group_by"]
+        ]
+
+        # Parsing for SQL based on each type of manipulation. Bucketing the datetime
+        # columns here means the rollup happens in Odyssey rather than in pandas
+        def group_by_col_sql(x):
+            if time_granularity is not None and table.types[x] == "datetime":
+                return f"DATE_TRUNC('{time_granularity}', {to_odyssey[x]}) {x}"
+            return f"{to_odyssey[x]} {x}"
+
+        group_by_cols_sql = ", ".join([group_by_col_sql(x) for x in group_by_cols])
+
+        if len(sum_columns_pre_query) > 0:
+            sum_cols_sql = ", "  +  ", ".join([f"SUM({to_odyssey[x]}) {x}" for x in sum_columns_pre_query])
+        else:
+            sum_cols_sql = ""
+        if len(count_columns_pre_query) > 0:
+            count_cols_sql = ", " +  ", ".join([f"{to_odyssey[x]} {x}" for x in count_columns_pre_query])
+        else:
+            count_cols_sql = ""
+        
+        # Filters may use either lab or Odyssey names; Odyssey names are sent
+        def translate(filters):
+            return _translate_filters(filters, to_odyssey)
+
+        filters_sql = translate(filters)
+
+        def build_query(filters_sql):
+            return f"""SELECT {group_by_cols_sql} {sum_cols_sql} {count_cols_sql}
+                    FROM {table.name}
+                    WHERE {filters_sql}
+                    GROUP BY {" ,".join(group_by_cols)}
+            """
+
+        query = build_query(filters_sql)
+
+        def process(df):
+            return _add_calculated_columns(df, columns)
+
+    if cache in ["read", "only"]:
+        df = QUERY_CACHE.get(query)
+        if df is not None:
+            return iter([process(df)]) if stream else process(df)
+        if cache == "only":
+            print("No cached result was found for this query.")
+            return
+
+    # Every row of a GROUP BY result is a complete group, so the post-processing
+    # can be applied chunk by chunk without changing the answer
+    if stream:
+        return (
+            process(df)
+            for df in iter_sql_to_df(query, show_progress=show_progress, prefetch=prefetch)
+        )
+
+    if partitions:
+        partition_queries = [
+            build_query(
+                f"({filters_sql}) AND ({translate(x)})" if filters_sql else translate(x)
+            )
+            for x in partitions
+        ]
+        df = _run_partitioned(
+            partition_queries,
+            group_by_cols,
+            sum_columns_pre_query,
+            count_columns_pre_query,
+            max_workers=max_workers,
+            show_progress=show_progress,
+            prefetch=prefetch,
+        )
+    else:
+        df = sql_to_df(query, show_progress=show_progress, prefetch=prefetch)
+    if cache != "off":
+        QUERY_CACHE.put(query, df)
+    return process(df)
+
+
+# String literals, which are left alone, quoted identifiers and bare identifiers
+_FILTER_TOKENS = re.compile(r"""('(?:[^']|'')*')|"([^"]*)"|(?<![\w.@])([A-Za-z_@][\w.@]*)""")
+
+
+def _translate_filters(filters: str, names: dict) -> str:
+    """Renames the identifiers of a WHERE clause, leaving string literals untouched
+
+    Args:
+        filters (str): The "WHERE" part of a query, e.g. "site_name IN ('a','b')"
+        names (dict): The new name of each identifier to rename
+
+    Returns:
+        str: The filters, with every identifier outside string literals renamed
+    """
+
+    def rename(match):
+        literal, quoted, bare = match.groups()
+        if literal is not None:
+            return literal
+        if quoted is not None:
+            return f'"{names.get(quoted, quoted)}"'
+        return names.get(bare, bare)
+
+    return _FILTER_TOKENS.sub(rename, filters)
+
+
+# Buckets that `query()` can push down to Odyssey, with the matching pandas
+# period for aligning timestamps to bucket starts
+_TIME_GRANULARITIES = {"hour": "h", "day": "D", "month": "M", "year": "Y"}
+
+
+def _floor_time(timestamp: pd.Timestamp, time_granularity: Optional[str]) -> pd.Timestamp:
+    """Rounds a timestamp down to the start of its bucket"""
+    if time_granularity is None:
+        return timestamp
+    period = timestamp.tz_localize(None).to_period(_TIME_GRANULARITIES[time_granularity])
+    return period.start_time.tz_localize(timestamp.tz)
+
+
+# Materialized results of `refresh_query()`. These are never expired or evicted,
+# since losing one means downloading the whole history again
+INCREMENTAL_STORE = QueryCache(".query_store", ttl=None, max_bytes=None)
+
+# Columns that `query()` derives after the fact, and so are not worth storing
+_CALCULATED_COLUMNS = ["ACPU", "ARPU", "year_month"]
+
+
+def refresh_query(
+    table_name: str,
+    columns: list,
+    filters: Optional[str] = "",
+    overlap: Optional[Any] = "31D",
+    show_progress: Optional[bool] = False,
+    prefetch: Optional[int] = 0,
+    store: Optional[QueryCache] = None,
+    time_granularity: Optional[str] = None,
+) -> pd.DataFrame:
+    """Runs a lab-name `query()` incrementally against a locally stored result
+
+    The first call downloads everything and stores it. Later calls with the same
+    table, columns and filters only download rows from the stored high-water mark
+    (the latest timestamp) minus `overlap` onwards, which catches data that
+    arrived late. The stored rows in that window are replaced with the new ones.
+
+    Args:
+        table_name (str): lab name of the table, as in `query()`
+        columns (list): lab-name columns, as in `query()`. "timestamp" is added if
+        missing, because the refresh is driven by it.
+        filters (str, optional): the "WHERE" part of the query, as in `query()`. Defaults to "".
+        overlap (Any, optional): how far before the high-water mark to re-download,
+        as anything `pd.Timedelta` understands. Defaults to "31D".
+        show_progress (bool, optional): whether you want to see progress of query. Defaults to False.
+        prefetch (int, optional): number of cursor pages to fetch ahead. Defaults to 0.
+        store (QueryCache, optional): where results are kept. Defaults to None,
+        which uses `INCREMENTAL_STORE`.
+        time_granularity (str, optional): bucket pushed down to Odyssey, as in
+        `query()`. The overlap is widened to whole buckets, so a partly stored
+        bucket is always downloaded again in full. Defaults to None.
+
+    Returns:
+        pd.DataFrame: The full, up-to-date result, as `query()` would return it
+    """
+    if store is None:
+        store = INCREMENTAL_STORE
+    columns = list(columns)
+    if "timestamp" not in columns:
+        columns.append("timestamp")
+    key = json.dumps(
+        [table_name, sorted(set(columns)), QueryCache.normalize(filters), time_granularity]
+    )
+
+    stored = store.get(key)
+    if stored is None or len(stored) == 0:
+        df = query(
+            table_name=table_name,
+            columns=list(columns),
+            filters=filters,
+            show_progress=show_progress,
+            prefetch=prefetch,
+            cache="off",
+            time_granularity=time_granularity,
+        )
+    else:
+        cutoff = _floor_time(
+            stored["timestamp"].max() - pd.Timedelta(overlap), time_granularity
+        )
+        time_filter = f"timestamp >= '{cutoff.isoformat()}'"
+        new_filters = f"( {filters} ) AND {time_filter}" if filters.strip() else time_filter
+        new = query(
+            table_name=table_name,
+            columns=list(columns),
+            filters=new_filters,
+            show_progress=show_progress,
+            prefetch=prefetch,
+            cache="off",
+            time_granularity=time_granularity,
+        )
+        if show_progress:
+            print(f"{len(new)} rows read since {cutoff}")
+        df = pd.concat(
+            [stored[stored["timestamp"] < cutoff], new.drop(columns=_CALCULATED_COLUMNS, errors="ignore")],
+            ignore_index=True,
+        )
+
+    df = df.drop(columns=_CALCULATED_COLUMNS, errors="ignore")
+    store.put(key, df)
+    return _add_calculated_columns(df, columns)
+
+
+def make_partitions(
+    start: Optional[Any] = None,
+    end: Optional[Any] = None,
+    freq: Optional[str] = "MS",
+    sites: Optional[list] = None,
+    sites_per_partition: Optional[int] = 50,
+    time_column: Optional[str] = "timestamp",
+    site_column: Optional[str] = "site_name",
+) -> List[str]:
+    """Builds disjoint filters that split a `query()` by time range and/or site
+
+    Args:
+        start (Optional[Any], optional): Start of the first time range, as anything
+        `pd.Timestamp` understands. Defaults to None, which does not split by time.
+        end (Optional[Any], optional): End of the last time range (exclusive).
+        Required together with `start`.
+        freq (Optional[str], optional): pandas frequency of the time ranges. Defaults
+        to "MS", one partition per calendar month.
+        sites (Optional[list], optional): Site names to split by. Defaults to None,
+        which does not split by site.
+        sites_per_partition (Optional[int], optional): Number of sites in each site
+        partition. Defaults to 50.
+        time_column (Optional[str], optional): Lab name of the time column. Defaults
+        to "timestamp".
+        site_column (Optional[str], optional): Lab name of the site column. Defaults
+        to "site_name".
+
+    Returns:
+        List[str]: One filter string per partition, to be passed as `partitions`
+    """
+    time_filters = [None]
+    if (start is None) != (end is None):
+        raise ValueError("Both start and end are needed to split a query by time.")
+    if start is not None:
+        edges = list(pd.date_range(start, end, freq=freq))
+        edges = [pd.Timestamp(start)] + [x for x in edges if x > pd.Timestamp(start)]
+        if edges[-1] < pd.Timestamp(end):
+            edges.append(pd.Timestamp(end))
+        time_filters = [
+            f"{time_column} >= '{a.isoformat()}' AND {time_column} < '{b.isoformat()}'"
+            for a, b in zip(edges[:-1], edges[1:])
+        ]
+
+    site_filters = [None]
+    if sites is not None:
+        site_filters = [
+            f"{site_column} IN " + parse_to_sql(sites[i : i + sites_per_partition], how="list")
+            for i in range(0, len(sites), sites_per_partition)
+        ]
+
+    return [
+        " AND ".join([x for x in [t, s] if x is not None])
+        for t in time_filters
+        for s in site_filters
+    ]
+
+
+def _run_partitioned(
+    queries: List[str],
+    group_by_cols: List[str],
+    sum_cols: List[str],
+    count_cols: List[str],
+    max_workers: int = 4,
+    show_progress: bool = False,
+    prefetch: int = 0,
+) -> pd.DataFrame:
+    """Runs partition queries concurrently and merges them into one result
+
+    Groups that span several partitions (e.g. a site's total when partitioning by
+    month) come back once per partition, so the summed columns are summed again
+    over the group-by columns after merging. Distinct counts are not additive (a
+    meter active in two months would count twice), so such groups raise a
+    ValueError when a count column is selected.
+    """
+    cnxn = get_connection()
+
+    def run(q):
+        return sql_to_df(q, cnxn, prefetch=prefetch)
+
+    dfs = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, df in enumerate(executor.map(run, queries)):
+            dfs.append(df)
+            if show_progress:
+                print(f"{i + 1} of {len(queries)} partitions read")
+
+    df = pd.concat(dfs, ignore_index=True)
+    if len(group_by_cols) > 0 and df.duplicated(subset=group_by_cols).any():
+        if len(count_cols) > 0:
+            raise ValueError(
+                f"Some groups span several partitions, so their distinct counts ({', '.join(count_cols)}) "
+                "cannot be merged. Partition along one of the group-by columns instead."
+            )
+        df = (
+            df.groupby(group_by_cols, dropna=False, sort=False)[sum_cols]
+            .sum(min_count=1)
+            .reset_index()
+        )
+    return df
+
+
+def _add_calculated_columns(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """Adds the post-query calculated fields requested in a lab-name query
+
+    Args:
+        df (pd.DataFrame): The raw result of the generated query
+        columns (list): The lab-name columns requested in `query()`
+
+    Returns:
+        pd.DataFrame: The same DataFrame with ACPU, ARPU and year_month derived
+    """
+    if "ACPU" in columns:
+        df["ACPU"] = df["consump_kwh"] / df["meter_count"]
+
+    if "ARPU" in columns:
+        df["ARPU"] = df["revenue_lc"] / df["meter_count"]
+
+    if "timestamp" in df.columns:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], utc = True)
+
+    if "year_month" in columns:
+        df["year_month"] = df["timestamp"].dt.tz_localize(None).dt.to_period('M')
+
+    return df
+
+def get_year_month_col(df, date_col = "timestamp"):
+    df["year_month"] = df[date_col].dt.tz_localize(None).dt.to_period('M')
@@ -0,0 +1,207 @@
+"""
+osm: offline counts of OpenStreetMap features per hexagon, from a local extract
+
+The `run_buildings_df` loop in `examples/Buildings.py` calls
+`ox.features.features_from_polygon()` for every hexagon, which is one Overpass
+request each, and appends each row to the table with `pd.concat()`. Here a local
+OSM extract (a Geofabrik `.osm.pbf`, say) is read once, through GDAL's OSM
+driver, keeping only features with the tags of interest. The features are
+matched to the hexagons with one bulk STR tree query, and every hexagon x tag
+count comes out of a single `np.bincount`.
+
+As with `features_from_polygon()`, a feature counts towards every hexagon it
+intersects, so a road crossing three hexagons counts in each.
+"""
+
+import re
+import warnings
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Optional, Sequence
+
+from .joins import CellIndex
+
+try:
+    import pyogrio
+except ImportError:
+    warnings.warn(
+        "The package pyogrio is not found. Not the end of the world, but you cannot read OSM extracts in repo_utils.osm."
+    )
+
+# The columns of `run_buildings_df`: for each OSM key, the column counting each value
+DEFAULT_TAGS = {
+    "highway": {
+        "residential": "Residential Roads",
+        "service": "Service Roads",
+        "unclassified": "Unclassified Roads",
+        "secondary": "Secondary Roads",
+        "tertiary": "Tertiary Roads",
+        "path": "Path Roads",
+        "trunk": "Trunk Roads",
+        "trunk_link": "Trunk Link Roads",
+    },
+    "building": {
+        "yes": "No. Buildings",
+        "house": "No. Houses",
+        "commercial": "No. Commercial",
+        "industrial": "No. Industrial",
+        "hotel": "No. Hotels",
+        "apartments": "No. Apartments",
+        "retail": "No. Retail",
+        "school": "No. Educational",
+    },
+}
+
+# Total columns, each summing the counted values of one key
+DEFAULT_TOTALS = {"Total Buildings": "building", "Total Roads": "highway"}
+
+# The GDAL OSM driver's layers that can hold tagged features
+_LAYERS = ("points", "lines", "multipolygons")
+
+
+def _other_tag(other_tags: pd.Series, key: str) -> pd.Series:
+    """Pulls one key out of the driver's hstore-style "other_tags" column"""
+    return other_tags.str.extract(f'"{re.escape(key)}"=>"((?:[^"\\\\]|\\\\.)*)"', expand=False)
+
+
+def _like_escape(text: str) -> str:
+    """Escapes a literal for a LIKE pattern with ESCAPE '\\', and for its SQL quotes"""
+    text = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return text.replace("'", "''")
+
+
+def read_osm_features(
+    path: str,
+    tags: Dict[str, Optional[Sequence[str]]],
+    bbox: Optional[Sequence[float]] = None,
+) -> Any:
+    """Reads the features with some tags from an OSM extract
+
+    Each layer of the file is read once. Keys with a column of their own in the
+    driver's default configuration (like "highway" on lines and "building" on
+    polygons) are filtered by GDAL; other keys are found in "other_tags".
+
+    Args:
+        path (str): An `.osm.pbf` or `.osm` file
+        tags (Dict[str, Optional[Sequence[str]]]): The values to keep for each key,
+        e.g. {"highway": ["residential", "service"], "building": None}. None keeps
+        every value.
+        bbox (Optional[Sequence[float]], optional): (minx, miny, maxx, maxy) in
+        lon/lat to read. Defaults to None, the whole file.
+
+    Returns:
+        A GeoDataFrame in EPSG:4326 with one column per key and a geometry
+    """
+    import geopandas as gpd
+
+    frames = []
+    for layer in _LAYERS:
+        fields = set(pyogrio.read_info(path, layer=layer)["fields"])
+        conditions = []
+        for key, values in tags.items():
+            if key in fields:
+                if values is None:
+                    conditions.append(f"{key} IS NOT NULL")
+                else:
+                    quoted = ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+                    conditions.append(f"{key} IN ({quoted})")
+            else:
+                conditions.append(f"other_tags LIKE '%\"{_like_escape(key)}\"=>%' ESCAPE '\\'")
+        columns = [key for key in tags if key in fields]
+        if any(key not in fields for key in tags):
+            columns.append("other_tags")
+        df = pyogrio.read_dataframe(
+            path,
+            layer=layer,
+            columns=columns,
+            where=" OR ".join(conditions),
+            bbox=tuple(bbox) if bbox is not None else None,
+        )
+        for key, values in tags.items():
+            if key not in fields:
+                df[key] = _other_tag(df["other_tags"], key)
+            if values is not None:
+                df[key] = df[key].where(df[key].isin(list(values)))
+        frames.append(df[list(tags) + ["geometry"]])
+    features = pd.concat(frames, ignore_index=True)
+    return gpd.GeoDataFrame(features, geometry="geometry", crs="EPSG:4326")
+
+
+def count_features(
+    hexagons: Any,
+    features: Any,
+    tags: Dict[str, Dict[str, str]] = DEFAULT_TAGS,
+    totals: Dict[str, str] = DEFAULT_TOTALS,
+    id_column: str = "h3",
+    index: Optional[CellIndex] = None,
+) -> pd.DataFrame:
+    """Counts the features of each tag in each hexagon
+
+    Args:
+        hexagons (Any): A GeoDataFrame of hexagons in EPSG:4326, such as
+        `hex_customers_population`
+        features (Any): A GeoDataFrame with one column per key, from
+        `read_osm_features()`
+        tags (Dict[str, Dict[str, str]], optional): For each key, the column
+        counting each value. Defaults to `DEFAULT_TAGS`, the columns of
+        `run_buildings_df`.
+        totals (Dict[str, str], optional): Total columns, each summing the columns
+        of one key. Defaults to `DEFAULT_TOTALS`.
+        id_column (str, optional): The hexagons' id column. Defaults to "h3".
+        index (Optional[CellIndex], optional): A `CellIndex` of the hexagons from
+        an earlier call, to reuse its tree. Defaults to None.
+
+    Returns:
+        pd.DataFrame: One row per hexagon, aligned with `hexagons`, with the id
+        column, one count column per tag value and the totals
+    """
+    if index is None:
+        index = CellIndex(hexagons, id_column)
+    columns = [column for values in tags.values() for column in values.values()]
+    feature, cell = index.tree.query(np.asarray(features.geometry), predicate="intersects")
+
+    n_cells, n_columns = len(index), len(columns)
+    counts = np.zeros(n_cells * n_columns, dtype=np.int64)
+    offset = 0
+    for key, values in tags.items():
+        if key in features.columns:
+            # Position of each feature's value among the columns, -1 when not counted
+            codes = features[key].map({v: offset + i for i, v in enumerate(values)}).fillna(-1).to_numpy(np.int64)
+            code = codes[feature]
+            valid = code >= 0
+            counts += np.bincount(cell[valid] * n_columns + code[valid], minlength=n_cells * n_columns)
+        offset += len(values)
+
+    df = pd.DataFrame(counts.reshape(n_cells, n_columns), columns=columns, index=hexagons.index)
+    df.insert(0, id_column, index.ids)
+    for total, key in totals.items():
+        df[total] = df[list(tags[key].values())].sum(axis=1)
+    return df
+
+
+def count_osm_features(
+    path: str,
+    hexagons: Any,
+    tags: Dict[str, Dict[str, str]] = DEFAULT_TAGS,
+    totals: Dict[str, str] = DEFAULT_TOTALS,
+    id_column: str = "h3",
+) -> pd.DataFrame:
+    """Reads an OSM extract once and counts its features in every hexagon
+
+    This is the offline, whole-grid equivalent of `run_buildings_df`.
+
+    Args:
+        path (str): An `.osm.pbf` (or `.osm`) extract covering the hexagons, e.g.
+        a country from Geofabrik
+        hexagons (Any): A GeoDataFrame of hexagons in EPSG:4326
+        tags (Dict[str, Dict[str, str]], optional): See `count_features()`.
+        Defaults to `DEFAULT_TAGS`.
+        totals (Dict[str, str], optional): See `count_features()`. Defaults to
+        `DEFAULT_TOTALS`.
+        id_column (str, optional): The hexagons' id column. Defaults to "h3".
+
+    Returns:
+        pd.DataFrame: The counts, as `count_features()` returns them
+    """
+    features = read_osm_features(path, {key: list(values) for key, values in tags.items()}, hexagons.total_bounds)
+    return count_features(hexagons, features, tags, totals, id_column)
@@ -0,0 +1,55 @@
+"""
+paths: typical file names and directory paths used across the project
+"""
+
+import os
+
+# Constants: typical file names and directory paths
+
+
+# def get_dropbox_root(config_path: str = "user_config.yml") -> str:
+#     """Gets the Dropbox root folder in an OS- and user-independent way
+#     Args:
+#         config_path (str, optional): A full or relative path to the user_config
+#         containing (among other things) the Dropbox folder location on the local
+#         system. Defaults to "user_config.yml".
+#     Returns:
+#         str: The full path to the Dropbox root folder, formatted correctly for OS
+#     """
+#     if not os.path.isabs(config_path):
+#         config_path = os.path.join(os.path.dirname(__file__), config_path)
+#     with open(config_path, "r") as stream:
+#         data = yaml.safe_load(stream)
+#     return data["dropbox_root"]
+    
+def get_latest_path(path, date_length: int=6, catalog=None):
+    """Function to get the latest path
+    Args:
+        path (str): full path to file to get latest
+        date_lenght (int): length of date, defaults to 6
+        catalog (ArtifactCatalog, optional): a catalog of the file's folder, from
+        `repo_utils.catalog`. When given, the latest version in the file's folder
+        is looked up in its manifest instead of listing and sorting the folder.
+        Defaults to None.
+    Returns:
+        str: string of latest path to the selected file
+    """
+    if catalog is not None:
+        from .catalog import split_artifact_name
+
+        name, _, file_format = split_artifact_name(path)
+        return catalog.latest(name, file_format, folder=os.path.dirname(os.path.abspath(path)))
+    files = [x for x in os.listdir(os.path.dirname(path)) if os.path.basename(path)[date_length:] in x]
+    files.sort(reverse=True)
+    latest_file = files[0]
+    latest_path = os.path.join(os.path.dirname(path), latest_file)
+    return latest_path
+
+# dropbox_root = get_dropbox_root()
+
+project_root = os.path.join(
+    # dropbox_root,
+    "CB Data Analytics",
+    "1 Projects",
+    "12. KPLC Pilot Study",
+)
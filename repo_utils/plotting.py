@@ -0,0 +1,79 @@
+""" Plotly templates, graph and text color palettes
+    The template is not set on import. Set it as the Plotly default by running
+    `repo_utils.use_template()`.
+    There are two different palettes:
+        - 'text_palette' includes the five main CB-style colors for text
+        - 'graphs_palette' color scales used for graphs (blue, gray, red, green)
+"""
+
+import plotly.graph_objs as go
+import plotly.io as pio
+from sys import platform as _platform
+
+graphs_palette = {
+    "blue_1": "rgb(52, 58, 100)",
+    "blue_2": "rgb(51, 58, 135)",
+    "blue_3": "rgb(157, 177, 208)",
+    "blue_4": "rgb(195, 207, 226)",
+    "gray_1": "rgb(0, 0, 0)",
+    "gray_2": "rgb(128, 128, 128)",
+    "gray_3": "rgb(150, 150, 150)",
+    "gray_4": "rgb(192, 192, 192)",
+    "red_1": "rgb(232, 28, 0)",
+    "red_2": "rgb(195, 10, 61)",
+    "red_3": "rgb(250, 134, 148)",
+    "red_4": "rgb(255, 193, 193)",
+    "green_1": "rgb(152, 219, 212)",
+    "green_2": "rgb(176, 235, 229)",
+    "green_3": "rgb(205, 254, 243)",
+    "green_4": "rgb(247, 255, 247)",
+}
+
+text_palette = {
+    "header_blue": "rgb(52,58,100)",
+    "gray_main": "rgb(105,105,105)",
+    "light_gray": "rgb(191,191,191)",
+    "yellow": "rgb(255,192,0)",
+    "magenta": "rgb(196,40,90)",
+}
+
+
+if _platform == "darwin":
+    text_font = "Gill Sans"
+else:
+    text_font = "Gill Sans MT"
+
+
+def use_template():
+    """Sets CB style template for the for the notebook."""
+    fig = go.Figure(
+        layout=dict(
+            title="Figure Title",
+            font=dict(size=14, family=text_font, color=text_palette["gray_main"]),
+            showlegend=True,
+            plot_bgcolor="white",
+            colorway=[
+                graphs_palette[x] for x in ["blue_1", "gray_1", "red_1", "green_1"]
+            ],  # Can we do better?
+        )
+    )
+
+    fig.update_xaxes(
+        showline=True, linewidth=1, linecolor=text_palette["gray_main"], title="X Axis"
+    )
+    fig.update_yaxes(
+        showline=True,
+        linewidth=1,
+        linecolor=text_palette["gray_main"],
+        title="Y Axis",
+        showticklabels=True,
+        ticks="outside",
+        tickwidth=1,
+        tickcolor=text_palette["gray_main"],
+    )
+    templated_fig = pio.to_templated(fig)
+
+    pio.templates["cb_graph"] = templated_fig.layout.template
+
+    pio.templates.default = "cb_graph"
+
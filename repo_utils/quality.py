@@ -0,0 +1,309 @@
+"""
+quality: data-quality checks for DataFrames, such as key and dependency checks
+
+The checks encode each key into dense integer codes with hash-table dictionaries
+that persist from chunk to chunk, and keep only small per-code summaries. This
+means they can run over a single DataFrame, an iterable of DataFrame chunks or
+a Parquet file read batch by batch, with memory growing with the number of
+distinct keys rather than the number of rows.
+"""
+
+import itertools
+import numpy as np
+import pandas as pd
+from typing import Iterable, Iterator, List, Optional, Union
+
+
+def _iter_chunks(
+    data: Union[pd.DataFrame, str, Iterable[pd.DataFrame]],
+    columns: List[str],
+    chunksize: int,
+) -> Iterator[pd.DataFrame]:
+    """Yields the requested columns of the data one chunk at a time
+
+    Args:
+        data (Union[pd.DataFrame, str, Iterable[pd.DataFrame]]): A DataFrame, a path
+        to a Parquet file, or an iterable of DataFrame chunks
+        columns (List[str]): The columns needed
+        chunksize (int): Rows per chunk when splitting a DataFrame or Parquet file
+
+    Yields:
+        pd.DataFrame: Consecutive chunks holding only `columns`
+    """
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, len(data), chunksize):
+            yield data.iloc[start : start + chunksize][columns]
+    elif isinstance(data, str):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(data).iter_batches(
+            batch_size=chunksize, columns=columns
+        ):
+            yield batch.to_pandas()
+    else:
+        for chunk in data:
+            yield chunk[columns]
+
+
+class _Encoder:
+    """Maps the values of one column to dense integer codes, stable across chunks"""
+
+    def __init__(self):
+        self.uniques = None
+
+    def __len__(self) -> int:
+        return 0 if self.uniques is None else len(self.uniques)
+
+    def encode(self, values: Union[pd.Series, np.ndarray]) -> np.ndarray:
+        # Missing values get a code of their own, as drop_duplicates treats them
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        uniques = pd.Index(uniques)
+        if self.uniques is None:
+            self.uniques = uniques
+            return codes.astype(np.int64)
+        mapped = self.uniques.get_indexer(uniques)
+        new = mapped == -1
+        mapped[new] = len(self.uniques) + np.arange(new.sum())
+        if new.any():
+            self.uniques = self.uniques.append(uniques[new])
+        return mapped[codes].astype(np.int64)
+
+
+class _KeyEncoder:
+    """Maps combinations of column values to dense integer codes, stable across chunks"""
+
+    def __init__(self, columns: List[str], encoders: Optional[dict] = None):
+        self.columns = columns
+        # One encoder per column, which may be shared with other keys, then one
+        # per step of combining them pairwise
+        if encoders is None:
+            encoders = {col: _Encoder() for col in columns}
+        self.encoders = [encoders[col] for col in columns]
+        self.combiners = [_Encoder() for _ in columns[1:]]
+
+    def __len__(self) -> int:
+        return len((self.combiners or self.encoders)[-1])
+
+    def encode(self, chunk: pd.DataFrame, column_codes: Optional[dict] = None) -> np.ndarray:
+        if column_codes is None:
+            column_codes = {}
+        codes = None
+        for i, (col, encoder) in enumerate(zip(self.columns, self.encoders)):
+            col_codes = column_codes.get(col)
+            if col_codes is None:
+                col_codes = encoder.encode(chunk[col])
+            if codes is None:
+                codes = col_codes
+            else:
+                # Both codes are far below 2**32, so the pair packs into one integer
+                codes = self.combiners[i - 1].encode((codes << 32) | col_codes)
+        return codes
+
+
+def _print_primary_key(n_rows: int, n_dupes: int, candidate: List[str]):
+    print(
+        f"There are {n_rows} rows in the DataFrame, and {n_dupes} of them ({100*n_dupes/n_rows}%) have duplicate candidate key values."
+    )
+    if n_dupes == 0:
+        print("The candidate key [" + ", ".join(candidate) + "] IS a primary key.")
+    else:
+        print(
+            "The candidate key [" + ", ".join(candidate) + "] is NOT a primary key."
+        )
+
+
+def profile_primary_key(
+    data: Union[pd.DataFrame, str, Iterable[pd.DataFrame]],
+    candidate: List[str],
+    show_debug: Optional[bool] = True,
+    chunksize: Optional[int] = 1_000_000,
+) -> bool:
+    """Checks if a given subset of columns is a primary key, chunk by chunk
+
+    Args:
+        data (Union[pd.DataFrame, str, Iterable[pd.DataFrame]]): A DataFrame, a
+        path to a Parquet file, or an iterable of DataFrame chunks
+        candidate (List[str]): A list of some subset of the data's columns
+        show_debug (Optional[bool], optional): Whether to print diagnostic details to
+        the screen. Defaults to True.
+        chunksize (Optional[int], optional): Rows per chunk when splitting a
+        DataFrame or Parquet file. Defaults to 1,000,000.
+
+    Returns:
+        bool: Whether or not the candidate key is a primary key for the data
+    """
+    encoder = _KeyEncoder(candidate)
+    counts = np.zeros(0, dtype=np.int64)
+    for chunk in _iter_chunks(data, candidate, chunksize):
+        chunk_counts = np.bincount(encoder.encode(chunk), minlength=len(encoder))
+        counts = np.pad(counts, (0, len(chunk_counts) - len(counts))) + chunk_counts
+
+    n_dupes = int(counts[counts > 1].sum())
+    if show_debug:
+        _print_primary_key(int(counts.sum()), n_dupes, candidate)
+    return n_dupes == 0
+
+
+def profile_functional_dependency(
+    data: Union[pd.DataFrame, str, Iterable[pd.DataFrame]],
+    determinant: List[str],
+    dependent: List[str],
+    show_debug: Optional[bool] = True,
+    chunksize: Optional[int] = 1_000_000,
+) -> bool:
+    """Checks every dependent key against the determinant in one grouped pass
+
+    For each determinant value, only the smallest and largest code of every
+    dependent key are kept: a key is functionally dependent exactly when the two
+    agree for every determinant value.
+
+    Args:
+        data (Union[pd.DataFrame, str, Iterable[pd.DataFrame]]): A DataFrame, a
+        path to a Parquet file, or an iterable of DataFrame chunks
+        determinant (List[str]): The potential determinant key set
+        dependent (List[str]): The potential dependent key set
+        show_debug (Optional[bool], optional): Whether to print diagnostic details to
+        the screen. Defaults to True.
+        chunksize (Optional[int], optional): Rows per chunk when splitting a
+        DataFrame or Parquet file. Defaults to 1,000,000.
+
+    Returns:
+        bool: Returns True only if _all_ of the candidate dependent keys show functional dependency on the determinant keys
+    """
+    all_keys = determinant + dependent
+    if len(all_keys) != len(set(all_keys)):
+        raise RuntimeError(
+            "There can be no overlaps between the determinant and the dependent keys to be checked."
+        )
+
+    det_encoder = _KeyEncoder(determinant)
+    dep_encoders = {dep_key: _Encoder() for dep_key in dependent}
+    mins = pd.DataFrame(columns=dependent, dtype=np.int64)
+    maxs = pd.DataFrame(columns=dependent, dtype=np.int64)
+    for chunk in _iter_chunks(data, all_keys, chunksize):
+        codes = pd.DataFrame(
+            {dep_key: dep_encoders[dep_key].encode(chunk[dep_key]) for dep_key in dependent},
+            index=det_encoder.encode(chunk),
+        )
+        grouped = codes.groupby(level=0)
+        if len(mins) == 0:
+            mins, maxs = grouped.min(), grouped.max()
+        else:
+            mins = pd.concat([mins, grouped.min()]).groupby(level=0).min()
+            maxs = pd.concat([maxs, grouped.max()]).groupby(level=0).max()
+
+    result = True
+    for dep_key in dependent:
+        is_dependent = bool((mins[dep_key] == maxs[dep_key]).all())
+        result = result and is_dependent
+        if show_debug:
+            print(f"For key {dep_key}:")
+            if is_dependent:
+                print("This key IS dependent on the determinant.")
+            else:
+                print("This key is NOT functionally dependent.")
+            print(f"There are {len(det_encoder)} unique values of the determinant key")
+            print(
+                f"There are {len(dep_encoders[dep_key])} unique values of the key {dep_key}."
+            )
+    return result
+
+
+def find_candidate_keys(
+    data: Union[pd.DataFrame, str, Iterable[pd.DataFrame]],
+    columns: Optional[List[str]] = None,
+    max_size: Optional[int] = 3,
+    chunksize: Optional[int] = 1_000_000,
+) -> List[List[str]]:
+    """Searches for the minimal candidate keys of a dataset
+
+    Column sets are tried smallest first, with one pass over the data per size.
+    Supersets of a key already found are skipped, since they cannot be minimal.
+
+    Args:
+        data (Union[pd.DataFrame, str, Iterable[pd.DataFrame]]): A DataFrame, a
+        path to a Parquet file, or a re-iterable collection (e.g. a list) of
+        DataFrame chunks. One-shot iterators cannot be used, as the data is read
+        once per key size.
+        columns (Optional[List[str]], optional): The columns to build keys from.
+        Defaults to None, which uses every column of a DataFrame and is otherwise
+        required.
+        max_size (Optional[int], optional): The largest number of columns in a
+        key. Defaults to 3.
+        chunksize (Optional[int], optional): Rows per chunk when splitting a
+        DataFrame or Parquet file. Defaults to 1,000,000.
+
+    Returns:
+        List[List[str]]: Every minimal candidate key with up to `max_size` columns
+    """
+    if columns is None:
+        if not isinstance(data, pd.DataFrame):
+            raise ValueError("The columns must be given unless the data is a DataFrame.")
+        columns = list(data.columns)
+
+    keys = []
+    for size in range(1, max_size + 1):
+        candidates = [
+            list(x)
+            for x in itertools.combinations(columns, size)
+            if not any(set(key) <= set(x) for key in keys)
+        ]
+        if len(candidates) == 0:
+            break
+        needed = [col for col in columns if any(col in x for x in candidates)]
+
+        # Columns are encoded once per chunk and shared by every candidate
+        col_encoders = {col: _Encoder() for col in needed}
+        key_encoders = [_KeyEncoder(x, col_encoders) for x in candidates]
+        n_rows = 0
+        for chunk in _iter_chunks(data, needed, chunksize):
+            n_rows += len(chunk)
+            col_codes = {col: col_encoders[col].encode(chunk[col]) for col in needed}
+            for encoder in key_encoders:
+                encoder.encode(chunk, col_codes)
+
+        keys += [x for x, encoder in zip(candidates, key_encoders) if len(encoder) == n_rows]
+    return keys
+
+
+def check_for_primary_key(
+    df: pd.DataFrame, candidate: List[str], show_debug: Optional[bool] = True
+) -> bool:
+    """Checks if a given subset of columns is a primary key for a DataFrame
+
+    Args:
+        df (pd.DataFrame): A data frame
+        candidate (List[str]): A list of some subset of df's columns. The function will
+        check if each row of df has a unique combination of the candidate values
+        show_debug (Optional[bool], optional): Whether to print diagnostic details to
+        the screen. Defaults to True.
+
+    Returns:
+        bool: Whether or not the candidate key is a primary key for df
+    """
+    return profile_primary_key(
+        df, candidate, show_debug=show_debug, chunksize=max(len(df), 1)
+    )
+
+
+def check_for_functional_dependency(
+    df: pd.DataFrame,
+    determinant: List[str],
+    dependent: List[str],
+    show_debug: Optional[bool] = True,
+) -> bool:
+    """Check if named dependent keys are, in fact, functionally dependent in a DataFrame
+
+    Args:
+        df (pd.DataFrame): The DataFrame of interest
+        determinant (List[str]): The potential determinant key set
+        dependent (List[str]): The potential dependent key set
+        show_debug (Optional[bool], optional): Whether to print diagnostic details to
+        the screen. Defaults to True.
+
+    Returns:
+        bool: Returns True only if _all_ of the candidate dependent keys show functional dependency on the determinant keys after being checked one-by-one
+    """
+    return profile_functional_dependency(
+        df, determinant, dependent, show_debug=show_debug, chunksize=max(len(df), 1)
+    )
@@ -0,0 +1,230 @@
+"""
+sampling: local stratified sampling of dark-area control points
+
+Notebooks 09 and 11 draw their control points (rural, desert, jungle, ocean and
+built) with Earth Engine: a `focal_max(10000, 'circle', 'meters')` buffer
+around built-up pixels is masked out, then `sample()` is called with far more
+pixels than needed, since most come back masked. Here the same exclusion zone is
+computed locally with a Euclidean distance transform, tile by tile so a whole
+continent fits in memory, and exactly N points are drawn per landcover stratum
+and country from the eligible pixels.
+
+Each (stratum, country) pair gets its own random generator, seeded from the base
+seed and the pair's names, so adding a country or a stratum never changes the
+points drawn for the others.
+"""
+
+import warnings
+import zlib
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+from typing import Any, Dict, List, Optional, Sequence
+
+from .zonal import _M_PER_DEG_LAT, _M_PER_DEG_LON, _as_tuple
+
+try:
+    import rasterio.features
+except ImportError:
+    warnings.warn(
+        "The package rasterio is not found. Not the end of the world, but you cannot rasterize country polygons in repo_utils.sampling."
+    )
+
+# ESA WorldCover classes
+WORLDCOVER_CLASSES = {
+    10: "tree cover",
+    20: "shrubland",
+    30: "grassland",
+    40: "cropland",
+    50: "built-up",
+    60: "bare / sparse vegetation",
+    70: "snow and ice",
+    80: "permanent water bodies",
+    90: "herbaceous wetland",
+    95: "mangroves",
+    100: "moss and lichen",
+}
+
+
+def built_exclusion(
+    landcover: np.ndarray,
+    transform: Sequence[float],
+    built_class: int = 50,
+    distance: float = 10000,
+    tile_size: int = 2048,
+) -> np.ndarray:
+    """Marks every pixel within a distance of a built-up pixel
+
+    This is the local equivalent of `built.focal_max(distance, 'circle', 'meters')`.
+    The raster is processed in tiles, each padded by enough pixels to see every
+    built-up pixel within `distance`. On a lon/lat grid, each tile measures
+    distances with the pixel width at its highest latitude, so the zone is never
+    narrower than asked for.
+
+    Args:
+        landcover (np.ndarray): A (height, width) landcover raster, e.g. WorldCover
+        transform (Sequence[float]): The raster's affine transform, in degrees
+        built_class (int, optional): The built-up class. Defaults to 50, as in WorldCover.
+        distance (float, optional): The exclusion distance, in metres. Defaults to 10000.
+        tile_size (int, optional): Tile height and width, in pixels. Defaults to 2048.
+
+    Returns:
+        np.ndarray: A boolean (height, width) mask, True where points are excluded
+    """
+    a, _, c, _, e, f = _as_tuple(transform)
+    height, width = landcover.shape
+    dy = abs(e) * _M_PER_DEG_LAT
+    excluded = np.zeros((height, width), dtype=bool)
+    for r0 in range(0, height, tile_size):
+        r1 = min(r0 + tile_size, height)
+        lat = max(abs(f + r0 * e), abs(f + r1 * e))
+        dx = abs(a) * _M_PER_DEG_LON * np.cos(np.radians(min(lat, 89.0)))
+        # Pixels of padding needed to see every built-up pixel within `distance`
+        pad_r, pad_c = int(np.ceil(distance / dy)) + 1, int(np.ceil(distance / dx)) + 1
+        y0, y1 = max(r0 - pad_r, 0), min(r1 + pad_r, height)
+        for c0 in range(0, width, tile_size):
+            c1 = min(c0 + tile_size, width)
+            x0, x1 = max(c0 - pad_c, 0), min(c1 + pad_c, width)
+            built = np.asarray(landcover[y0:y1, x0:x1]) == built_class
+            if not built.any():
+                continue
+            nearest = ndimage.distance_transform_edt(~built, sampling=(dy, dx))
+            excluded[r0:r1, c0:c1] = nearest[r0 - y0 : r1 - y0, c0 - x0 : c1 - x0] <= distance
+    return excluded
+
+
+def rasterize_zones(
+    gdf: Any,
+    column: str,
+    transform: Sequence[float],
+    shape: tuple,
+) -> tuple:
+    """Burns polygons, such as countries, into an integer zone raster
+
+    Args:
+        gdf (Any): A GeoDataFrame of polygons in the raster's CRS
+        column (str): The column naming each zone, e.g. "ADM0_NAME"
+        transform (Sequence[float]): The raster's affine transform
+        shape (tuple): The raster's (height, width)
+
+    Returns:
+        tuple: (zones, names). zones is an int32 raster, 0 outside every polygon,
+        and names maps each zone code to its name.
+    """
+    from affine import Affine
+
+    names = dict(enumerate(gdf[column].astype(str), start=1))
+    zones = rasterio.features.rasterize(
+        zip(gdf.geometry, names),
+        out_shape=shape,
+        transform=Affine(*_as_tuple(transform)),
+        fill=0,
+        dtype="int32",
+    )
+    return zones, names
+
+
+def _seed(seed: int, *names: str) -> List[int]:
+    """A stable seed sequence for a base seed and a tuple of names"""
+    return [seed] + [zlib.crc32(str(x).encode()) for x in names]
+
+
+def sample_strata(
+    landcover: np.ndarray,
+    transform: Sequence[float],
+    strata: Dict[str, Optional[Sequence[int]]],
+    n: int,
+    zones: Optional[np.ndarray] = None,
+    zone_names: Optional[Dict[int, str]] = None,
+    exclusion: Optional[np.ndarray] = None,
+    exempt: Sequence[str] = ("built",),
+    seed: int = 44,
+) -> Any:
+    """Draws exactly N random pixel centres per landcover stratum and zone
+
+    Args:
+        landcover (np.ndarray): A (height, width) landcover raster
+        transform (Sequence[float]): The raster's affine transform, in degrees
+        strata (Dict[str, Optional[Sequence[int]]]): The landcover classes of each
+        stratum, e.g. {"rural": [10, 20, 30, 40, 60], "built": [50]}. None
+        accepts any class.
+        n (int): Points per stratum and zone. Zones with fewer eligible pixels give
+        all they have, with a warning.
+        zones (Optional[np.ndarray], optional): An integer raster of zones (e.g.
+        countries, from `rasterize_zones()`), 0 outside them. Defaults to None,
+        which treats the whole raster as one zone.
+        zone_names (Optional[Dict[int, str]], optional): The name of each zone
+        code. Defaults to None, which uses the codes.
+        exclusion (Optional[np.ndarray], optional): A mask of pixels to avoid, from
+        `built_exclusion()`. Defaults to None.
+        exempt (Sequence[str], optional): Strata the exclusion does not apply to.
+        Defaults to ("built",).
+        seed (int, optional): The base random seed. Defaults to 44, as in the notebooks.
+
+    Returns:
+        A GeoDataFrame of points with "type" (the stratum), "country" (the zone)
+        and "Map" (the landcover class) columns, as the notebooks' samples
+    """
+    import geopandas as gpd
+
+    a, _, c, _, e, f = _as_tuple(transform)
+    landcover = np.asarray(landcover)
+    width = landcover.shape[1]
+    if zone_names is None:
+        zone_names = {}
+    # Each zone is searched only within its bounding window
+    if zones is None:
+        windows = {0: (slice(0, landcover.shape[0]), slice(0, width))}
+    else:
+        zones = np.asarray(zones)
+        windows = {
+            i + 1: x for i, x in enumerate(ndimage.find_objects(zones)) if x is not None
+        }
+
+    frames = []
+    for stratum, classes in strata.items():
+        for zone, (rows, cols) in windows.items():
+            window = landcover[rows, cols]
+            if classes is None:
+                eligible = np.ones(window.shape, dtype=bool)
+            elif window.dtype == np.uint8:
+                # A lookup table is much faster than np.isin on byte rasters
+                lookup = np.zeros(256, dtype=bool)
+                lookup[list(classes)] = True
+                eligible = lookup[window]
+            else:
+                eligible = np.isin(window, classes)
+            if zones is not None:
+                eligible &= zones[rows, cols] == zone
+            if exclusion is not None and stratum not in exempt:
+                eligible &= ~np.asarray(exclusion[rows, cols])
+            window_rows, window_cols = np.nonzero(eligible)
+            # Candidates in raster order, so the draw does not depend on the window
+            candidates = (window_rows + rows.start) * width + window_cols + cols.start
+
+            name = zone_names.get(zone, str(zone))
+            if len(candidates) < n:
+                warnings.warn(
+                    f"Only {len(candidates)} eligible pixels for {stratum} in {name}, fewer than {n}."
+                )
+            rng = np.random.default_rng(_seed(seed, stratum, name))
+            chosen = np.sort(rng.choice(candidates, size=min(n, len(candidates)), replace=False))
+            chosen_rows, chosen_cols = np.divmod(chosen, width)
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "type": stratum,
+                        "country": name,
+                        "Map": landcover[chosen_rows, chosen_cols],
+                        "x": c + (chosen_cols + 0.5) * a,
+                        "y": f + (chosen_rows + 0.5) * e,
+                    }
+                )
+            )
+
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["type", "country", "Map", "x", "y"])
+    return gpd.GeoDataFrame(
+        df.drop(columns=["x", "y"]),
+        geometry=gpd.points_from_xy(df["x"], df["y"]),
+        crs="EPSG:4326",
+    )
@@ -0,0 +1,209 @@
+"""
+streaming: running means and quantile sketches over extraction chunks
+
+Notebook 25 writes the nightlights of every background point to GeoJSON, and
+only then reduces them to one mean and median per point type and month
+(`data/dark_bg/nightlights_means_medians.csv`). A `StreamingSummary` builds the
+same table straight from the extraction chunks as they arrive, keeping only a
+running sum and count and a small quantile sketch per (type, month), so its
+memory does not grow with the number of points.
+
+The sketch puts values into logarithmic buckets, so every quantile it returns is
+within a fixed relative error (1% by default) of a value of that rank. Sketches with
+the same accuracy merge exactly, so chunks can be summarised in parallel and
+combined afterwards.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+from .panel import _DATE_COLUMN, month_code
+
+
+class QuantileSketch:
+    """A mergeable quantile sketch with a relative error guarantee
+
+    Positive and negative values go into logarithmic buckets of ratio
+    (1 + accuracy) / (1 - accuracy), and values closer to zero than `min_value`
+    are counted as zero.
+
+    Args:
+        relative_accuracy (float, optional): The largest relative error of a
+        returned quantile. Defaults to 0.01.
+        min_value (float, optional): The smallest magnitude told apart from zero.
+        Defaults to 1e-9.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self._offset = int(np.floor(np.log(min_value) / self._log_gamma))
+        self.positive = np.zeros(0, dtype=np.int64)
+        self.negative = np.zeros(0, dtype=np.int64)
+        self.zeros = 0
+        self.count = 0
+
+    def _keys(self, magnitudes: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64) - self._offset
+
+    def _value(self, key: int) -> float:
+        # The point of the bucket (gamma**(k-1), gamma**k] with the smallest relative error
+        return 2 * self.gamma ** (key + self._offset) / (self.gamma + 1)
+
+    @staticmethod
+    def _add(store: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        if len(counts) > len(store):
+            store = np.pad(store, (0, len(counts) - len(store)))
+        store[: len(counts)] += counts
+        return store
+
+    def update(self, values: Any):
+        """Adds values to the sketch, ignoring NaN"""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        positive = values > self.min_value
+        negative = values < -self.min_value
+        if positive.any():
+            self.positive = self._add(self.positive, np.bincount(self._keys(values[positive])))
+        if negative.any():
+            self.negative = self._add(self.negative, np.bincount(self._keys(-values[negative])))
+        self.zeros += int(len(values) - positive.sum() - negative.sum())
+        self.count += len(values)
+
+    def merge(self, other: "QuantileSketch"):
+        """Adds another sketch's values to this one"""
+        if (other.relative_accuracy, other.min_value) != (self.relative_accuracy, self.min_value):
+            raise ValueError("Only sketches with the same accuracy and minimum value can be merged.")
+        self.positive = self._add(self.positive, other.positive)
+        self.negative = self._add(self.negative, other.negative)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """Returns the approximate q-quantile, or NaN if the sketch is empty"""
+        if self.count == 0:
+            return np.nan
+        rank = q * (self.count - 1)
+        # Values in ascending order: negatives (largest magnitude first), zeros, positives
+        n_negative = int(self.negative.sum())
+        if rank < n_negative:
+            cumulative = np.cumsum(self.negative[::-1])
+            key = len(self.negative) - 1 - int(np.searchsorted(cumulative, rank, side="right"))
+            return -self._value(key)
+        rank -= n_negative
+        if rank < self.zeros:
+            return 0.0
+        rank -= self.zeros
+        cumulative = np.cumsum(self.positive)
+        key = int(np.searchsorted(cumulative, rank, side="right"))
+        return self._value(min(key, len(self.positive) - 1))
+
+
+def _quantile_name(q: float) -> str:
+    return "median" if q == 0.5 else f"q{round(q * 100):02d}"
+
+
+class StreamingSummary:
+    """Per-group, per-month means and quantiles, updated one chunk at a time
+
+    Args:
+        group_columns (Sequence[str], optional): The columns identifying each
+        group. Defaults to ("type",), as in notebook 25.
+        quantiles (Sequence[float], optional): The quantiles to report. Defaults
+        to (0.5,), giving a "median" column.
+        relative_accuracy (float, optional): The quantile sketches' relative
+        accuracy. Defaults to 0.01.
+    """
+
+    def __init__(
+        self,
+        group_columns: Sequence[str] = ("type",),
+        quantiles: Sequence[float] = (0.5,),
+        relative_accuracy: float = 0.01,
+    ):
+        self.group_columns = list(group_columns)
+        self.quantiles = list(quantiles)
+        self.relative_accuracy = relative_accuracy
+        # (group values, YYYYMM month) -> [sum, count, sketch]
+        self.cells: Dict[Tuple, list] = {}
+        self.n_rows = 0
+
+    def _cell(self, key: Tuple) -> list:
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = [0.0, 0, QuantileSketch(self.relative_accuracy)]
+            self.cells[key] = cell
+        return cell
+
+    def update(self, chunk: pd.DataFrame):
+        """Adds a chunk of extraction results
+
+        Args:
+            chunk (pd.DataFrame): Either wide, with the group columns and one
+            "YYYYMMDD" (or "YYYYMM"/"YYYY") column per month, as written by
+            `zonal_stats()` and `run_extraction()`, or long, with the group columns
+            and "month" (or "date") and "value" columns, as read from a `PanelStore`
+        """
+        self.n_rows += len(chunk)
+        if "value" in chunk.columns:
+            months = chunk["month"] if "month" in chunk.columns else chunk["date"].map(month_code)
+            long = chunk[self.group_columns].assign(_month=np.asarray(months), _value=chunk["value"].to_numpy())
+            for key, group in long.groupby(self.group_columns + ["_month"], observed=True, sort=False):
+                self._add(key if isinstance(key, tuple) else (key,), group["_value"].to_numpy())
+            return
+
+        date_columns = [col for col in chunk.columns if _DATE_COLUMN.match(str(col))]
+        months = [month_code(col) for col in date_columns]
+        for key, group in chunk.groupby(self.group_columns, observed=True, sort=False):
+            key = key if isinstance(key, tuple) else (key,)
+            values = group[date_columns].to_numpy(dtype=np.float64)
+            for month, column in zip(months, values.T):
+                self._add(key + (month,), column)
+
+    def _add(self, key: Tuple, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        cell = self._cell(tuple(key))
+        cell[0] += float(values.sum())
+        cell[1] += len(values)
+        cell[2].update(values)
+
+    def consume(self, chunks: Iterable[pd.DataFrame]) -> "StreamingSummary":
+        """Adds every chunk of an iterable, e.g. a generator of extraction batches"""
+        for chunk in chunks:
+            self.update(chunk)
+        return self
+
+    def merge(self, other: "StreamingSummary"):
+        """Adds another summary's data to this one, e.g. from a parallel worker"""
+        if other.group_columns != self.group_columns:
+            raise ValueError("Only summaries over the same group columns can be merged.")
+        for key, (total, count, sketch) in other.cells.items():
+            cell = self._cell(key)
+            cell[0] += total
+            cell[1] += count
+            cell[2].merge(sketch)
+        self.n_rows += other.n_rows
+
+    def summary(self) -> pd.DataFrame:
+        """Returns one row per group and month with count, mean and quantiles
+
+        Returns:
+            pd.DataFrame: The group columns, "date" (as "YYYY-MM-DD", like
+            `nightlights_means_medians.csv`), "count", "mean" and one column per
+            quantile, sorted by group and date
+        """
+        rows = []
+        for key, (total, count, sketch) in self.cells.items():
+            *groups, month = key
+            row = dict(zip(self.group_columns, groups))
+            row["date"] = f"{month // 100:04d}-{month % 100:02d}-01"
+            row["count"] = count
+            row["mean"] = total / count if count else np.nan
+            for q in self.quantiles:
+                row[_quantile_name(q)] = sketch.quantile(q)
+            rows.append(row)
+        columns = self.group_columns + ["date", "count", "mean"] + [_quantile_name(q) for q in self.quantiles]
+        return pd.DataFrame(rows, columns=columns).sort_values(self.group_columns + ["date"], ignore_index=True)
@@ -0,0 +1,194 @@
+"""
+tiling: space-filling-curve ordering and raster tile batches for site sets
+
+Site files are stored in whatever order they were collected, which jumps around
+the continent: consecutive sites rarely share a raster tile, so a tile cache
+keeps evicting tiles it will need again. A `SiteIndex` orders sites along a
+Hilbert (or Morton) curve, groups them by the raster tile they fall in, and
+hands out batches of whole tiles, so every tile is read about once.
+"""
+
+import numpy as np
+import shapely
+from typing import Any, Dict, Iterator, Optional, Sequence
+
+
+def hilbert_keys(x: np.ndarray, y: np.ndarray, order: int = 16) -> np.ndarray:
+    """Returns the distance of integer grid cells along a Hilbert curve
+
+    Args:
+        x (np.ndarray): Cell columns, in [0, 2**order)
+        y (np.ndarray): Cell rows, in [0, 2**order)
+        order (int, optional): Bits per coordinate. Defaults to 16.
+
+    Returns:
+        np.ndarray: The int64 Hilbert index of each cell
+    """
+    x = np.asarray(x, dtype=np.int64).copy()
+    y = np.asarray(y, dtype=np.int64).copy()
+    n = 1 << order
+    d = np.zeros(x.shape, dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        # Rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return d
+
+
+def morton_keys(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Returns the Z-order (Morton) index of integer grid cells, up to 2**16 a side"""
+
+    def spread(v):
+        v = np.asarray(v, dtype=np.int64) & 0xFFFF
+        v = (v | (v << 8)) & 0x00FF00FF
+        v = (v | (v << 4)) & 0x0F0F0F0F
+        v = (v | (v << 2)) & 0x33333333
+        v = (v | (v << 1)) & 0x55555555
+        return v
+
+    return spread(x) | (spread(y) << 1)
+
+
+def _curve_keys(x: np.ndarray, y: np.ndarray, curve: str, order: int) -> np.ndarray:
+    if curve == "hilbert":
+        return hilbert_keys(x, y, order)
+    if curve == "morton":
+        return morton_keys(x, y)
+    raise ValueError(f"Curve {curve} not currently supported.")
+
+
+class SiteIndex:
+    """Orders a set of sites along a space-filling curve, grouped by raster tile
+
+    Args:
+        sites (Any): A GeoDataFrame of sites, or their geometries. Polygons are
+        placed by the centre of their bounds. Missing or empty geometries have no
+        place on the curve, and are ordered last.
+        transform (Optional[Sequence[float]], optional): The affine transform
+        (a, b, c, d, e, f) of the raster grid to group by. Defaults to None, which
+        orders the sites along the curve without grouping them.
+        tile_size (int, optional): The grid's tile size, in pixels, e.g. a
+        `TimeCube`'s. Defaults to 256.
+        curve (str, optional): "hilbert" or "morton". Defaults to "hilbert".
+        bounds (Optional[Sequence[float]], optional): The (minx, miny, maxx, maxy)
+        the curve spans. Defaults to None, which uses the sites' own bounds.
+    """
+
+    def __init__(
+        self,
+        sites: Any,
+        transform: Optional[Sequence[float]] = None,
+        tile_size: int = 256,
+        curve: str = "hilbert",
+        bounds: Optional[Sequence[float]] = None,
+    ):
+        geometries = np.asarray(sites.geometry if hasattr(sites, "geometry") else sites)
+        box = shapely.bounds(geometries).reshape(-1, 4)
+        x, y = (box[:, 0] + box[:, 2]) / 2, (box[:, 1] + box[:, 3]) / 2
+        # Missing or empty geometries have no position: they go last, in file order
+        self.valid = np.isfinite(x) & np.isfinite(y)
+        located = np.flatnonzero(self.valid)
+        missing = np.flatnonzero(~self.valid)
+        x, y = x[located], y[located]
+        if bounds is None:
+            bounds = (x.min(), y.min(), x.max(), y.max()) if len(located) else (0.0, 0.0, 1.0, 1.0)
+        minx, miny, maxx, maxy = bounds
+        order = 16
+        cells = (1 << order) - 1
+        col = np.clip((x - minx) / max(maxx - minx, 1e-12) * cells, 0, cells)
+        # Rows count down from the top, as in rasters
+        row = np.clip((maxy - y) / max(maxy - miny, 1e-12) * cells, 0, cells)
+        # -1 for the sites without a position
+        self.keys = np.full(len(geometries), -1, dtype=np.int64)
+        self.keys[located] = _curve_keys(col.astype(np.int64), row.astype(np.int64), curve, order)
+
+        if transform is None:
+            self.tile_rows = self.tile_cols = None
+            located_order = np.argsort(self.keys[located], kind="stable")
+        else:
+            from .zonal import _as_tuple
+
+            a, _, c, _, e, f = _as_tuple(transform)
+            tile_rows = np.floor((y - f) / e / tile_size).astype(np.int64)
+            tile_cols = np.floor((x - c) / a / tile_size).astype(np.int64)
+            self.tile_rows = np.zeros(len(geometries), dtype=np.int64)
+            self.tile_cols = np.zeros(len(geometries), dtype=np.int64)
+            self.tile_rows[located], self.tile_cols[located] = tile_rows, tile_cols
+            if len(located):
+                # Tiles follow the curve over the tile grid, and sites follow it inside each tile
+                tile_row0, tile_col0 = tile_rows.min(), tile_cols.min()
+                span = max(tile_rows.max() - tile_row0, tile_cols.max() - tile_col0) + 1
+                tile_keys = _curve_keys(
+                    tile_cols - tile_col0,
+                    tile_rows - tile_row0,
+                    curve,
+                    max(int(np.ceil(np.log2(span))), 1),
+                )
+                located_order = np.lexsort((self.keys[located], tile_keys))
+            else:
+                located_order = np.zeros(0, dtype=np.int64)
+        self.order = np.concatenate([located[located_order], missing]).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def sort(self, sites: Any) -> Any:
+        """Returns the sites in curve order"""
+        return sites.iloc[self.order]
+
+    def tiles(self) -> Dict[tuple, np.ndarray]:
+        """Maps each (tile row, tile col) to the positions of its sites, in curve order
+
+        Sites without a position are in no tile.
+        """
+        if self.tile_rows is None:
+            raise ValueError("The index was built without a raster grid.")
+        tiles = {}
+        for position in self.order[self.valid[self.order]]:
+            key = (int(self.tile_rows[position]), int(self.tile_cols[position]))
+            tiles.setdefault(key, []).append(position)
+        return {key: np.array(value) for key, value in tiles.items()}
+
+    def iter_batches(self, batch_size: int) -> Iterator[np.ndarray]:
+        """Yields site positions in batches of whole tiles, following the curve
+
+        Tiles are packed into a batch until the next one would overflow it; a tile
+        with more than `batch_size` sites is split on its own. Without a raster
+        grid, this is simply consecutive runs of the curve order. Sites without a
+        position come last, in batches of their own.
+
+        Args:
+            batch_size (int): The most sites per batch
+
+        Yields:
+            np.ndarray: The positions of each batch's sites
+        """
+        if self.tile_rows is None:
+            for start in range(0, len(self.order), batch_size):
+                yield self.order[start : start + batch_size]
+            return
+
+        batch = []
+        for positions in self.tiles().values():
+            if batch and len(batch) + len(positions) > batch_size:
+                yield np.array(batch)
+                batch = []
+            for start in range(0, len(positions), batch_size):
+                part = list(positions[start : start + batch_size])
+                if len(part) == batch_size:
+                    yield np.array(part)
+                else:
+                    batch += part
+        if batch:
+            yield np.array(batch)
+        missing = self.order[~self.valid[self.order]]
+        for start in range(0, len(missing), batch_size):
+            yield missing[start : start + batch_size]